@@ -1,63 +1,549 @@
-import heapq
-from heuristics import ManhattanDistance, ManhattanImproved, PlayerDistance, CombinedHeuristic, ManhattanDistanceWithDeadlockDetection, CombinedHeuristicWithDeadlockDetection, ManhattanDistanceWithCorralDeadlockDetection
-from deadlocks import load_all_playable_positions_for_boxes
+import numpy as np
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from heuristics import ManhattanDistance, ManhattanImproved, PlayerDistance, CombinedHeuristic, ManhattanDistanceWithDeadlockDetection, CombinedHeuristicWithDeadlockDetection, ManhattanDistanceWithCorralDeadlockDetection, PushDistance, PushDistanceImproved, PatternDatabaseHeuristic, build_heuristic, get_heuristic_cache
+from deadlocks import get_dead_squares, check_freeze_deadlock, reachable_mask
 import time
-import os
 from generate_outputs import write_output, write_output_for_visualization
-from map import MapInfo
+from deadlock_patterns import get_deadlock_patterns
+from map import compile_map
+
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+# 2-bit code of each direction, for the moves kept in StateTable
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# Below this many states a get_batch call costs more than evaluating them one by one
+BATCH_MIN_SIZE = 6
 
 class State:
-    def __init__(self, boxes, player, targets, box_moved=False):
-        self.boxes = frozenset(boxes) 
-        self.player = player
-        self.targets = frozenset(targets)
+    # Compact state: boxes are a sorted tuple of flattened cell indices and the hash is a Zobrist
+    # key updated incrementally on every move, so lookups in the search tables never rehash the box set.
+    # `region` is the player cell used for identity: the player cell itself for step moves, or the
+    # smallest reachable cell once the state is normalized for push-level search.
+    # `h_cache` keeps the (value, info) pair of box-only heuristics so children can start from it.
+    # `_reachable` caches player_region(), shared by every state with the same boxes and player region.
+    __slots__ = ('map', 'box_cells', 'player_cell', 'region', 'hash', 'boxes_on_goal', 'box_moved', '_boxes', 'h_cache', '_reachable')
+
+    def __init__(self, map, box_cells, player_cell, hash, boxes_on_goal, box_moved=False, region=None):
+        self.map = map
+        self.box_cells = box_cells
+        self.player_cell = player_cell
+        self.region = player_cell if region is None else region
+        self.hash = hash
+        self.boxes_on_goal = boxes_on_goal
         self.box_moved = box_moved
+        self._boxes = None
+        self.h_cache = None
+        self._reachable = None
+
+    @classmethod
+    def from_map(cls, map):
+        return cls.from_cells(map, [map.index(box) for box in map.boxes], map.index(map.player))
+
+    @classmethod
+    def from_cells(cls, map, box_cells, player_cell):
+        box_cells = tuple(sorted(box_cells))
+        hash = map.zobrist_player[player_cell]
+        for cell in box_cells:
+            hash ^= map.zobrist_box[cell]
+        boxes_on_goal = sum(map.goal_cells[cell] for cell in box_cells)
+        return cls(map, box_cells, player_cell, hash, boxes_on_goal)
+
+    # Coordinates are only decoded when a heuristic or the output asks for them
+    @property
+    def boxes(self):
+        if self._boxes is None:
+            self._boxes = frozenset(self.map.position(cell) for cell in self.box_cells)
+        return self._boxes
+
+    @property
+    def player(self):
+        return self.map.position(self.player_cell)
+
+    @property
+    def targets(self):
+        return self.map.targets
 
     def __hash__(self):
-        return hash((self.boxes, self.player))  
+        return self.hash
 
     def __eq__(self, other):
-        return self.boxes == other.boxes and self.player == other.player
+        return self.hash == other.hash and self.region == other.region and self.box_cells == other.box_cells
     
     def __lt__(self, other):
-        return (self.player, self.boxes) < (other.player, other.boxes)
+        return (self.region, self.box_cells) < (other.region, other.box_cells)
 
     def __str__(self):
         return f"Player: {self.player}, Boxes: {self.boxes}"
 
+    def has_box(self, cell):
+        i = bisect_left(self.box_cells, cell)
+        return i < len(self.box_cells) and self.box_cells[i] == cell
+
     def move(self, direction, map):
-        new_player_pos = (self.player[0] + direction[0], self.player[1] + direction[1])
-        box_moved = False
+        offset = map.offset(direction)
+        new_player_cell = self.player_cell + offset
         # Check wall
-        if new_player_pos in map.walls:
+        if map.wall_cells[new_player_cell]:
             return None
-        
+
         # If the movement moves a box, check it's a valid move
-        new_boxes = set(self.boxes)
-        if new_player_pos in self.boxes:
-            new_box_pos = (new_player_pos[0] + direction[0], new_player_pos[1] + direction[1])
-            if new_box_pos in map.walls or new_box_pos in self.boxes:
-                # Avoids moving boxes into walls or into other boxes
-                return None
-            box_moved = True
-            new_boxes.remove(new_player_pos)
-            new_boxes.add(new_box_pos)
-        return State(frozenset(new_boxes), new_player_pos, self.targets, box_moved)
+        if self.has_box(new_player_cell):
+            return self.push(new_player_cell, offset, map)
+
+        hash = self.hash ^ map.zobrist_player[self.region] ^ map.zobrist_player[new_player_cell]
+        child = State(map, self.box_cells, new_player_cell, hash, self.boxes_on_goal)
+        # Same boxes and player region as the parent, so the decoded coordinates and the flood fill can be shared
+        child._boxes = self._boxes
+        child._reachable = self._reachable
+        return child
+
+    # Pushes the box at box_cell by offset, leaving the player where the box was
+    def push(self, box_cell, offset, map):
+        new_box_cell = box_cell + offset
+        if map.wall_cells[new_box_cell] or self.has_box(new_box_cell):
+            # Avoids moving boxes into walls or into other boxes
+            return None
+        new_box_cells = list(self.box_cells)
+        new_box_cells.remove(box_cell)
+        insort(new_box_cells, new_box_cell)
+        hash = self.hash ^ map.zobrist_player[self.region] ^ map.zobrist_player[box_cell]
+        hash ^= map.zobrist_box[box_cell] ^ map.zobrist_box[new_box_cell]
+        boxes_on_goal = self.boxes_on_goal + map.goal_cells[new_box_cell] - map.goal_cells[box_cell]
+        return State(map, tuple(new_box_cells), box_cell, hash, boxes_on_goal, True)
+
+    # Cells the player can walk to without pushing, as (bytearray indexed by cell, smallest reachable cell).
+    # Computed once per region (see deadlocks.reachable_mask) and shared with the siblings reached by player moves.
+    def player_region(self, map):
+        if self._reachable is None:
+            self._reachable = reachable_mask(map, self.player_cell, set(self.box_cells))
+        return self._reachable
+
+    # Breadth-first walk over the reachable cells, for when the distances are needed.
+    # Maps each reachable cell to (previous cell, direction, distance) so walks can be rebuilt.
+    def reachable(self, map):
+        came_from = {self.player_cell: (None, None, 0)}
+        queue = deque([self.player_cell])
+        box_set = set(self.box_cells)
+        while queue:
+            cell = queue.popleft()
+            distance = came_from[cell][2] + 1
+            for direction in DIRECTIONS:
+                next_cell = cell + map.offset(direction)
+                if next_cell in came_from or map.wall_cells[next_cell] or next_cell in box_set:
+                    continue
+                came_from[next_cell] = (cell, direction, distance)
+                queue.append(next_cell)
+        return came_from
+
+    # Same boxes, identified by the smallest cell of the player's region instead of the exact player cell
+    def normalized(self, map):
+        region = self.player_region(map)[1]
+        if region == self.region:
+            return self
+        hash = self.hash ^ map.zobrist_player[self.region] ^ map.zobrist_player[region]
+        state = State(map, self.box_cells, self.player_cell, hash, self.boxes_on_goal, self.box_moved, region)
+        state._boxes = self._boxes
+        state._reachable = self._reachable
+        return state
+
+    # Successors at push level: every push the player can reach from its region.
+    # Returns (normalized child, (box cell, direction), player steps including the walk)
+    def pushes(self, map):
+        came_from = self.reachable(map)
+        result = []
+        for box_cell in self.box_cells:
+            for direction in DIRECTIONS:
+                offset = map.offset(direction)
+                stand_cell = box_cell - offset
+                if stand_cell not in came_from:
+                    continue
+                child = self.push(box_cell, offset, map)
+                if child is None:
+                    continue
+                result.append((child.normalized(map), (box_cell, direction), came_from[stand_cell][2] + 1))
+        return result
+
+    # Inverse of push(): the box at box_cell is pulled back by offset and the player steps back behind it
+    def pull(self, box_cell, offset, map):
+        new_box_cell = box_cell - offset
+        new_player_cell = new_box_cell - offset
+        new_box_cells = list(self.box_cells)
+        new_box_cells.remove(box_cell)
+        insort(new_box_cells, new_box_cell)
+        hash = self.hash ^ map.zobrist_player[self.region] ^ map.zobrist_player[new_player_cell]
+        hash ^= map.zobrist_box[box_cell] ^ map.zobrist_box[new_box_cell]
+        boxes_on_goal = self.boxes_on_goal + map.goal_cells[new_box_cell] - map.goal_cells[box_cell]
+        return State(map, tuple(new_box_cells), new_player_cell, hash, boxes_on_goal, True)
+
+    # Predecessors at push level, for searching backwards from a solved state: every pull the player can do
+    # from its region. Returns (normalized predecessor, (box cell, direction) push that leads back here, 1)
+    def pulls(self, map):
+        came_from = self.reachable(map)
+        result = []
+        for box_cell in self.box_cells:
+            for direction in DIRECTIONS:
+                offset = map.offset(direction)
+                # The player has to be right after the push (where the box was) with room behind it
+                pushed_from = box_cell - offset
+                stand_cell = pushed_from - offset
+                if pushed_from not in came_from or map.wall_cells[stand_cell] or self.has_box(stand_cell):
+                    continue
+                parent = self.pull(box_cell, offset, map)
+                result.append((parent.normalized(map), (pushed_from, direction), 1))
+        return result
+
+    # Directions of a shortest walk from the player to target_cell (which must be reachable)
+    def walk(self, target_cell, map):
+        came_from = self.reachable(map)
+        directions = []
+        while target_cell != self.player_cell:
+            target_cell, direction, _ = came_from[target_cell]
+            directions.append(direction)
+        directions.reverse()
+        return directions
+
+    # Zobrist key of the boxes alone, shared by every player position with the same box configuration
+    def box_hash(self, map):
+        return self.hash ^ map.zobrist_player[self.region]
 
     def is_goal(self):
-        return self.boxes == self.targets
+        return self.boxes_on_goal == len(self.box_cells)
+
+# Successors of a state as (child, move, cost). A move is a direction for step-level search
+# and a (box cell, direction) push for push-level search.
+def get_successors(state, map, push_level=False):
+    if push_level:
+        return state.pushes(map)
+    successors = []
+    for direction in DIRECTIONS:
+        new_state = state.move(direction, map)
+        if new_state is not None:
+            successors.append((new_state, direction, 1))
+    return successors
+
+# Turns a sequence of pushes into the player steps that perform them, walking between pushes
+def expand_pushes(state, pushes, map):
+    directions = []
+    for box_cell, direction in pushes:
+        for step in state.walk(box_cell - map.offset(direction), map) + [direction]:
+            state = state.move(step, map)
+            directions.append(step)
+    return directions
+
+# States visited by the player following the directions, starting (and including) initial_state
+def replay_path(initial_state, directions, map):
+    path = [initial_state]
+    for direction in directions:
+        path.append(path[-1].move(direction, map))
+    return path
+
+# Cell of the box moved by a push: the player now stands where the box was, so it is one step further
+def pushed_box_cell(child, move, map, push_level):
+    direction = move[1] if push_level else move
+    return child.player_cell + map.offset(direction)
+
+# True when the child comes from a push into a known deadlock: a box frozen off goal (see deadlocks.check_freeze_deadlock)
+# or a learned deadlock pattern around the pushed box (see deadlock_patterns.py). Either check is skipped when None.
+def is_deadlocked_push(child, move, map, push_level, dead_squares, patterns):
+    if not child.box_moved:
+        return False
+    box_cell = pushed_box_cell(child, move, map, push_level)
+    if dead_squares is not None and check_freeze_deadlock(child, box_cell, map, dead_squares):
+        return True
+    return patterns is not None and patterns.matches(child, box_cell)
+
+# Box coordinates (states x boxes x 2) and player coordinates (states x 2) of a list of states, for get_batch
+def state_arrays(states, map):
+    box_cells = np.array([state.box_cells for state in states], dtype=np.int64)
+    player_cells = np.array([state.player_cell for state in states], dtype=np.int64)
+    return map.coordinates[box_cells], map.coordinates[player_cells]
+
+# Binds a heuristic from heuristics.py to the arguments it expects, once per search, so states are evaluated
+# with a plain evaluate(state) call instead of checking the type of the heuristic every time
+def bind_heuristic(heuristics, valid_box_positions):
+    if isinstance(heuristics, ManhattanDistanceWithDeadlockDetection):
+        return lambda state: heuristics.get(state.boxes, valid_box_positions)
+    if isinstance(heuristics, CombinedHeuristicWithDeadlockDetection):
+        return lambda state: heuristics.get(state.boxes, state.player, valid_box_positions)
+    if isinstance(heuristics, ManhattanDistanceWithCorralDeadlockDetection):
+        return lambda state: heuristics.get(state.boxes, state.player, valid_box_positions, state.box_moved, state.player_region(state.map)[0] if state.box_moved else None)
+    if heuristics.box_only:
+        return lambda state: heuristics.get(state.boxes)
+    return lambda state: heuristics.get(state.boxes, state.player)
+
+# A heuristic bound to one search. Box-only heuristics are shared between player moves and cached by box
+# configuration (see heuristics.get_heuristic_cache); the other ones are evaluated on every state.
+class Evaluator:
+    def __init__(self, heuristics, map, valid_box_positions, push_level=False, use_cache=True):
+        self.heuristics = heuristics
+        self.map = map
+        self.valid_box_positions = valid_box_positions
+        self.push_level = push_level
+        self.box_only = heuristics.box_only
+        self.incremental = self.box_only and hasattr(heuristics, 'get_incremental')
+        self.batch = hasattr(heuristics, 'get_batch')
+        self.cache = get_heuristic_cache(heuristics, map) if self.box_only and use_cache else None
+        self.get = bind_heuristic(heuristics, valid_box_positions)
+        self.cache_start = (self.cache.hits, self.cache.misses) if self.cache is not None else None
+
+    # Heuristic of a state; parent and move are the ones that generated it (None for the initial state).
+    # For box-only heuristics a child reached by a player move keeps its parent's (value, info) pair; otherwise
+    # the pair is looked up by box configuration in the cache and, on a miss, computed from the parent's pair
+    # when the heuristic has get_incremental (a push moves a single box) or from scratch.
+    def evaluate(self, state, parent=None, move=None):
+        if not self.box_only:
+            return self.get(state)
+        if parent is not None and not state.box_moved:
+            state.h_cache = parent.h_cache
+            return state.h_cache[0]
+
+        key = state.box_hash(self.map)
+        h_cache = self.cache.get(key) if self.cache is not None else None
+        if h_cache is None:
+            if not self.incremental:
+                h_cache = (self.get(state), None)
+            elif parent is None:
+                h_cache = self.heuristics.get_with_info(state.boxes)
+            else:
+                value, info = parent.h_cache
+                h_cache = self.heuristics.get_incremental(value, info, self.map.position(state.player_cell), self.map.position(pushed_box_cell(state, move, self.map, self.push_level)), state.boxes)
+            if self.cache is not None:
+                self.cache.put(key, h_cache)
+        state.h_cache = h_cache
+        return h_cache[0]
+
+    # Heuristic values of the children of `parent`, given as (child, move) pairs. Box-only heuristics go through
+    # evaluate and only the cache misses of non-incremental ones are left for the batch; every state that needs
+    # a fresh value is evaluated in one get_batch call when the heuristic has it and there are enough of them.
+    def evaluate_children(self, parent, children):
+        values = [None] * len(children)
+        pending = []
+        for i, (child, move) in enumerate(children):
+            if not self.box_only:
+                pending.append(i)
+            elif not child.box_moved or self.incremental:
+                values[i] = self.evaluate(child, parent, move)
+            else:
+                h_cache = self.cache.get(child.box_hash(self.map)) if self.cache is not None else None
+                if h_cache is None:
+                    pending.append(i)
+                else:
+                    child.h_cache = h_cache
+                    values[i] = h_cache[0]
+        if not pending:
+            return values
+
+        states = [children[i][0] for i in pending]
+        if self.batch and len(states) >= BATCH_MIN_SIZE:
+            boxes, players = state_arrays(states, self.map)
+            batch = self.heuristics.get_batch(boxes, players, self.valid_box_positions).tolist()
+        else:
+            batch = [self.get(state) for state in states]
+        for i, state, value in zip(pending, states, batch):
+            values[i] = value
+            if self.box_only:
+                state.h_cache = (value, None)
+                if self.cache is not None:
+                    self.cache.put(state.box_hash(self.map), state.h_cache)
+        return values
+
+    # Heuristic of a state whose children are evaluated by another evaluator (lazy search): the (value, info) pair
+    # they start from is left as it was
+    def refine(self, state):
+        h_cache = state.h_cache
+        value = self.evaluate(state)
+        state.h_cache = h_cache
+        return value
 
-class A_star:
-    def __init__(self, initial_state, heuristics, map, valid_box_positions):
+    # Hits and misses of the heuristic cache since the evaluator was created, for the search answer
+    def cache_counters(self):
+        if self.cache is None:
+            return 0, 0
+        return self.cache.hits - self.cache_start[0], self.cache.misses - self.cache_start[1]
+
+# Queue orders for BestFirstSearch: (priority, tie key) of a state with cost g and heuristic h
+def a_star_priority(g, h):
+    return int(g + h), int(h)
+
+def greedy_priority(g, h):
+    return int(h), g
+
+# Weighted A*: f = g + weight * h, so with an admissible heuristic solutions cost at most weight times the optimum
+def weighted_priority(weight):
+    return lambda g, h: (int(g + weight * h), int(h))
+
+# Priority queue for small non-negative integer priorities (f or h in this project): one bucket per priority and,
+# inside it, one stack per tie-breaking key, so push and pop are O(1) apart from moving the pointers to the
+# lowest non-empty bucket and stack. Lowest priority first, then lowest tie key, then the last item pushed.
+# Stale copies of a state are left in the queue; the searches skip them when they are popped.
+class BucketQueue:
+    def __init__(self):
+        # priority -> tie key -> items
+        self.buckets = []
+        # Lowest tie key that may be non-empty in each bucket
+        self.lowest = []
+        self.counts = []
+        self.minimum = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, priority, tie, item):
+        while len(self.buckets) <= priority:
+            self.buckets.append([])
+            self.lowest.append(0)
+            self.counts.append(0)
+        bucket = self.buckets[priority]
+        while len(bucket) <= tie:
+            bucket.append([])
+        bucket[tie].append(item)
+        self.counts[priority] += 1
+        self.size += 1
+        # Priorities and tie keys can go down with inconsistent heuristics
+        if tie < self.lowest[priority]:
+            self.lowest[priority] = tie
+        if priority < self.minimum:
+            self.minimum = priority
+
+    # Every item left in the queue, in no particular order
+    def items(self):
+        return [item for bucket in self.buckets for stack in bucket for item in stack]
+
+    # Returns (priority, item)
+    def pop(self):
+        while not self.counts[self.minimum]:
+            self.minimum += 1
+        priority = self.minimum
+        bucket = self.buckets[priority]
+        while not bucket[self.lowest[priority]]:
+            self.lowest[priority] += 1
+        self.counts[priority] -= 1
+        self.size -= 1
+        return priority, bucket[self.lowest[priority]].pop()
+
+# Closed set, g costs and parents of A_star in typed arrays instead of a set and two dicts keyed by State.
+# Entries are appended to parallel arrays (64-bit state key, 32-bit g, 32-bit parent entry and one byte holding
+# the 2-bit direction of the move plus the closed flag) and found through an open-addressing index of 32-bit
+# entry numbers with linear probing, kept at most half full and doubled when it fills up.
+# Keys are the states' Zobrist hashes, so two states would only share an entry if their 64-bit keys collided.
+class StateTable:
+    CLOSED = 4
+    # Set once the full heuristic of a lazy search was computed for the entry's current g
+    REFINED = 8
+
+    def __init__(self, capacity=1 << 10):
+        self.index = array('i', [-1]) * capacity
+        self.keys = array('Q')
+        self.g = array('i')
+        self.parents = array('i')
+        self.moves = bytearray()
+        self.closed = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Entry of a key, -1 if it is not in the table
+    def get(self, key):
+        return self.index[self.slot(key)]
+
+    def slot(self, key):
+        index = self.index
+        keys = self.keys
+        mask = len(index) - 1
+        slot = key & mask
+        while index[slot] >= 0 and keys[index[slot]] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    # Stores (or updates) the g, parent entry and move direction of a key and returns its entry
+    def put(self, key, g, parent, direction):
+        slot = self.slot(key)
+        entry = self.index[slot]
+        if entry >= 0:
+            self.g[entry] = g
+            self.parents[entry] = parent
+            self.moves[entry] = (self.moves[entry] & self.CLOSED) | direction
+            return entry
+        entry = len(self.keys)
+        self.keys.append(key)
+        self.g.append(g)
+        self.parents.append(parent)
+        self.moves.append(direction)
+        self.index[slot] = entry
+        if 2 * len(self.keys) > len(self.index):
+            self.grow()
+        return entry
+
+    def grow(self):
+        self.index = array('i', [-1]) * (2 * len(self.index))
+        for entry, key in enumerate(self.keys):
+            self.index[self.slot(key)] = entry
+
+    def close(self, entry):
+        self.moves[entry] |= self.CLOSED
+        self.closed += 1
+
+    # Clears the closed flag of every entry (the closed counter keeps counting expansions), for ARA*
+    def reopen(self):
+        self.moves = self.moves.translate(bytes(code & 3 for code in range(256)))
+
+    def is_closed(self, entry):
+        return entry >= 0 and self.moves[entry] & self.CLOSED
+
+    def refine(self, entry):
+        self.moves[entry] |= self.REFINED
+
+    def is_refined(self, entry):
+        return self.moves[entry] & self.REFINED
+
+    # (key, direction code) of every move from the root entry (the one without parent) to entry
+    def path(self, entry):
+        steps = []
+        while self.parents[entry] >= 0:
+            steps.append((self.keys[entry], self.moves[entry] & 3))
+            entry = self.parents[entry]
+        steps.reverse()
+        return steps
+
+    def memory(self):
+        return (self.index.itemsize * len(self.index) + self.keys.itemsize * len(self.keys)
+                + self.g.itemsize * len(self.g) + self.parents.itemsize * len(self.parents) + len(self.moves))
+
+# Best-first search shared by A*, Greedy and weighted A*. The heuristic is bound once into an Evaluator and the
+# order of the queue comes from priority(g, h), which returns the (priority, tie key) of a state
+# (see a_star_priority, greedy_priority and weighted_priority). Closed states are never reopened.
+# With lazy=True and a heuristic that has a cheap_heuristic, children are queued with the cheap one (never larger)
+# and the full heuristic only runs when a state reaches the top of the queue; if its priority grows the state is
+# queued again, so states are still expanded in the order of the full heuristic.
+class BestFirstSearch:
+    # Name written in data/stats.csv
+    algorithm = "BestFirst"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, priority=a_star_priority, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True, lazy=False):
+        # In push-level mode every successor is a box push and states are identified by the player's region
+        if push_level:
+            initial_state = initial_state.normalized(map)
         self.initial_state = initial_state
+        self.push_level = push_level
         self.heuristics = heuristics
-        self.explored = set()
-        self.priority_queue = []
-        self.g_cost_accum = {initial_state: 0}
-        self.parent = {}
-        self.frontier = set()
+        self.priority = priority
+        # Closed set, g costs and parents of every generated state (see StateTable)
+        self.table = StateTable()
+        self.priority_queue = BucketQueue()
         self.map = map
         self.valid_box_positions = valid_box_positions
+        self.evaluator = Evaluator(heuristics, map, valid_box_positions, push_level, use_cache)
+        # Heuristic the states are queued with: the cheap one in lazy mode, the full one otherwise
+        self.lazy = lazy and heuristics.cheap_heuristic is not None
+        self.push_evaluator = Evaluator(heuristics.cheap_heuristic(heuristics.goals, map.walls, map), map, valid_box_positions, push_level, use_cache) if self.lazy else self.evaluator
+        # Children left in a freeze deadlock or a learned deadlock pattern by their push are dropped before reaching the queue
+        self.dead_squares = get_dead_squares(map) if freeze_deadlocks else None
+        self.patterns = get_deadlock_patterns(map) if deadlock_patterns else None
+        self.pruned = 0
+        self.reinserted = 0
 
     def search(self):
 
@@ -65,135 +551,421 @@ class A_star:
 
         answer['frontier'] = 0
         answer['execution_time'] = time.time() # To substract from the end time
+        pattern_start = self.patterns.hits if self.patterns is not None else 0
 
-        heapq.heappush(self.priority_queue, (0, 0, self.initial_state))  # (f(n), g(n), state)
+        self.table.put(self.initial_state.hash, 0, -1, 0)
+        self.push(self.initial_state, 0, self.push_evaluator.evaluate(self.initial_state))
 
         while self.priority_queue:
-            f_n, g_n, current_state = heapq.heappop(self.priority_queue)
+            priority, (g_n, current_state) = self.priority_queue.pop()
+            current_entry = self.table.get(current_state.hash)
+            # Stale copy: the state was already expanded or reached again with a lower g
+            if self.table.is_closed(current_entry) or g_n > self.table.g[current_entry]:
+                continue
 
             if current_state.is_goal():
+                path, directions = self.get_path(current_entry)
                 f = open("data/stats.csv","a")
-                line = f"{self.map.name},A*,{self.heuristics.__class__.__name__},{(time.time() - answer['execution_time']) * 1000},{len(self.explored)},{len(self.priority_queue) + len(self.explored)},{len(self.get_path(current_state)[0])}\n"
+                line = f"{self.map.name},{self.algorithm},{self.heuristics.__class__.__name__},{(time.time() - answer['execution_time']) * 1000},{self.table.closed},{len(self.priority_queue) + self.table.closed},{len(path)}\n"
                 f.write(line)
                 f.close()
 
-                answer['explored'] = len(self.explored)
                 answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
-                answer['frontier'] = len(self.explored) + len(self.priority_queue)
-                answer['path'] = self.get_path(current_state)[0]
-                answer['directions'] = self.get_path(current_state)[1]
-                answer['g_n'] = g_n 
-                answer['result'] = "Exito"
-                return answer
+                answer['path'] = path
+                answer['directions'] = directions
+                answer['g_n'] = g_n
+                return self.finish(answer, "Exito", pattern_start)
 
-            self.explored.add(current_state)
+            if self.lazy and not self.table.is_refined(current_entry):
+                self.table.refine(current_entry)
+                if self.requeue(current_state, g_n, priority):
+                    continue
+
+            self.table.close(current_entry)
 
-            for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                new_state = current_state.move(direction, self.map)
-                if new_state is None or new_state in self.explored:
+            # First the children that improve their g, then all their heuristics at once
+            children = []
+            for new_state, move, cost in get_successors(current_state, self.map, self.push_level):
+                entry = self.table.get(new_state.hash)
+                if self.table.is_closed(entry):
+                    continue
+                if is_deadlocked_push(new_state, move, self.map, self.push_level, self.dead_squares, self.patterns):
+                    self.pruned += 1
                     continue
 
-                new_g_n = g_n + 1
-                if new_state not in self.g_cost_accum or new_g_n < self.g_cost_accum[new_state]:
-                    self.g_cost_accum[new_state] = new_g_n
-
-                    if isinstance(self.heuristics, (ManhattanDistanceWithDeadlockDetection)):
-                        f_n = new_g_n + self.heuristics.get(new_state.boxes, self.valid_box_positions)
-                    elif isinstance(self.heuristics, (CombinedHeuristicWithDeadlockDetection)):
-                        f_n = new_g_n + self.heuristics.get(new_state.boxes, new_state.player, self.valid_box_positions)
-                    elif isinstance(self.heuristics, (ManhattanDistanceWithCorralDeadlockDetection)):
-                        f_n = new_g_n + self.heuristics.get(new_state.boxes, new_state.player, self.valid_box_positions, new_state.box_moved)
-                    elif isinstance(self.heuristics, (ManhattanDistance, ManhattanImproved)):
-                        # ManhattanDistance and ManhattanImproved only take boxes
-                        f_n = new_g_n + self.heuristics.get(new_state.boxes)
-                    else:
-                        # PlayerDistance or CombinedHeuristic take boxes and player
-                        f_n = new_g_n + self.heuristics.get(new_state.boxes, new_state.player)
-                    heapq.heappush(self.priority_queue, (f_n, new_g_n, new_state))
-                    self.parent[new_state] = (current_state, direction)
+                new_g_n = g_n + cost
+                if entry < 0 or new_g_n < self.table.g[entry]:
+                    direction = move[1] if self.push_level else move
+                    self.table.put(new_state.hash, new_g_n, current_entry, DIRECTION_CODES[direction])
+                    children.append((new_state, new_g_n, move))
+
+            h_values = self.push_evaluator.evaluate_children(current_state, [(new_state, move) for new_state, _, move in children])
+            for (new_state, new_g_n, move), h_n in zip(children, h_values):
+                self.push(new_state, new_g_n, h_n)
 
         print("No path found.")
         answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
         answer['path'] = []
         answer['directions'] = []
-        answer['explored'] = len(self.explored)
         answer['g_n'] = 0
-        answer['result'] = "Fracaso"
-        return answer  # No path found
-    
-    def get_path(self, state):
-        path = []
-        directions = []
-    
-        while state in self.parent:
-            parent_state, direction = self.parent[state]
-            path.append(state)
-            directions.append(direction)
-            state = parent_state
-    
-        path.append(self.initial_state)
-        path.reverse()
-        directions.reverse()
-        return path, directions
+        return self.finish(answer, "Fracaso", pattern_start)
 
-def run_a_10_times():
+    def push(self, state, g, h):
+        # Deadlocked states never reach the goal
+        if h == float('inf'):
+            return
+        priority, tie = self.priority(g, h)
+        self.priority_queue.push(priority, tie, (g, state))
 
-    # if csv not exist create and add header
-    if 'stats.csv' not in os.listdir('data'):
-        file = open('data/stats.csv', 'w')
-        file.write('map,algorithm,heuristic,execution_time,explored,frontier,path_length\n')
-        file.close()
+    # Full heuristic of a state popped with the cheap one. Returns True when the state left the top of the queue:
+    # queued again with a larger priority, or dropped as a deadlock
+    def requeue(self, state, g, priority):
+        h = self.evaluator.refine(state)
+        if h == float('inf'):
+            self.pruned += 1
+            return True
+        if self.priority(g, h)[0] > priority:
+            self.reinserted += 1
+            self.push(state, g, h)
+            return True
+        return False
 
-    maps = []
-    for m in os.listdir('maps'):
-        maps.append(MapInfo(load_map(f"maps/{m}"), m))
-        map = MapInfo(load_map(f"maps/{m}"), m)
-        valid_box_positions = load_all_playable_positions_for_boxes(list(map.targets), list(map.walls)) 
-    
-        manhattan_distance = ManhattanDistance(map.targets)
-        manhattan_improved = ManhattanImproved(map.targets)
-        player_distance = PlayerDistance(map.targets)
-        combined_heuristic = CombinedHeuristic(map.targets)
-        manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets)
-        combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets)
-
-        initial_state = State(map.boxes, map.player, map.targets)
-        print("AStar - Manhattan Distance")
-        a_star_manhattan = A_star(initial_state, manhattan_distance, map, valid_box_positions)
-        answer = execute_a(a_star_manhattan)
-        write_output("AStar_manhattan", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    # Counters shared by the answers of every outcome
+    def finish(self, answer, result, pattern_start):
+        answer['explored'] = self.table.closed
+        answer['frontier'] = self.table.closed + len(self.priority_queue)
+        answer['bytes_per_state'] = self.table.memory() / len(self.table)
+        answer['pruned'] = self.pruned
+        answer['reinserted'] = self.reinserted
+        answer['pattern_hits'] = self.finish_patterns(pattern_start)
+        answer['cache_hits'], answer['cache_misses'] = self.evaluator.cache_counters()
+        answer['result'] = result
+        return answer
 
-        a_star_manhattan = A_star(initial_state, manhattan_distance, map, valid_box_positions)
-        execute_a(a_star_manhattan)
-        print("AStar - Manhattan Improved")
-        a_star_manhattan_improved = A_star(initial_state, manhattan_improved, map, valid_box_positions)
-        answer = execute_a(a_star_manhattan_improved)
-        write_output("AStar_manhattan_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    # Saves the patterns learned during the search and returns how many children they pruned
+    def finish_patterns(self, pattern_start):
+        if self.patterns is None:
+            return 0
+        self.patterns.save()
+        return self.patterns.hits - pattern_start
 
-        print("AStar - Player Distance")
-        a_star_player_distance = A_star(initial_state, player_distance, map, valid_box_positions)
-        answer = execute_a(a_star_player_distance)
-        write_output("AStar_player_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    # The table only keeps keys and directions, so the moves are replayed from the initial state. In push-level
+    # mode the push is the one in that direction whose child has the next key on the path.
+    def get_path(self, entry):
+        moves = []
+        state = self.initial_state
+        for key, code in self.table.path(entry):
+            direction = DIRECTIONS[code]
+            if self.push_level:
+                state, move = next((child, move) for child, move, _ in state.pushes(self.map) if move[1] == direction and child.hash == key)
+            else:
+                state, move = state.move(direction, self.map), direction
+            moves.append(move)
 
-        print("AStar - Combined")
-        a_star_combined = A_star(initial_state, combined_heuristic, map, valid_box_positions)
-        answer = execute_a(a_star_combined)
-        write_output("AStar_combined", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        directions = expand_pushes(self.initial_state, moves, self.map) if self.push_level else moves
 
-        print("AStar - Manhattan With Deadlock Detection")
-        a_star_manhattan_with_deadlock = A_star(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions)
-        answer = execute_a(a_star_manhattan_with_deadlock)
-        write_output("AStar_manhattan_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        # Replay the directions so the path holds one state per player step, also in push-level mode
+        return replay_path(self.initial_state, directions, self.map), directions
 
-        print("AStar - Combined With Deadlock Detection")
-        a_star_combined_with_deadlock = A_star(initial_state, combined_heuristic_with_deadlock_detection, map, valid_box_positions)
-        answer = execute_a(a_star_combined_with_deadlock)
-        write_output("AStar_combined_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+class A_star(BestFirstSearch):
+    algorithm = "A*"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True, lazy=False):
+        super().__init__(initial_state, heuristics, map, valid_box_positions, a_star_priority, push_level, use_cache, freeze_deadlocks, deadlock_patterns, lazy)
+
+class WeightedA_star(BestFirstSearch):
+    algorithm = "WA*"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, weight=2, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True, lazy=False):
+        super().__init__(initial_state, heuristics, map, valid_box_positions, weighted_priority(weight), push_level, use_cache, freeze_deadlocks, deadlock_patterns, lazy)
+        self.weight = weight
+
+# Anytime Repairing A* (Likhachev et al.): weighted A* with a decreasing weight that keeps its g values, parents
+# and open states between iterations. An iteration stops once no open state has a priority below the cost of the
+# best goal found; states improved after being expanded in it wait in `incons` and are queued again, with the
+# open ones, under the next weight. Each solution is yielded with its suboptimality bound
+# min(weight, cost / smallest g + h left), which reaches 1 when it is provably optimal (admissible heuristic).
+class ARA_star(BestFirstSearch):
+    algorithm = "ARA*"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, weights=(5, 3, 2, 1.5, 1.25, 1), deadline=None, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True):
+        super().__init__(initial_state, heuristics, map, valid_box_positions, weighted_priority(weights[0]), push_level, use_cache, freeze_deadlocks, deadlock_patterns)
+        self.weights = weights
+        # Seconds from the start of the search
+        self.deadline = deadline
+        self.incons = []
+        self.goal_g = None
+        self.goal_entry = None
+        self.pattern_start = 0
+
+    # Queue items keep h so the queue can be rebuilt for the next weight
+    def push(self, state, g, h):
+        if h == float('inf'):
+            return
+        priority, tie = self.priority(g, h)
+        self.priority_queue.push(priority, tie, (g, h, state))
+
+    # Runs every weight until the solution is provably optimal or the deadline is hit, calling callback with each
+    # answer, and returns the last one (the result is "Fracaso" when no solution was found)
+    def search(self, callback=None):
+        start = time.time()
+        answer = None
+        for answer in self.solutions():
+            if callback is not None:
+                callback(answer)
+        if answer is None:
+            print("No path found.")
+            answer = {'execution_time': (time.time() - start) * 1000, 'path': [], 'directions': [], 'g_n': 0, 'weight': None, 'bound': None}
+            return self.finish(answer, "Fracaso", self.pattern_start)
+
+        f = open("data/stats.csv","a")
+        line = f"{self.map.name},{self.algorithm},{self.heuristics.__class__.__name__},{answer['execution_time']},{answer['explored']},{answer['frontier']},{len(answer['path'])}\n"
+        f.write(line)
+        f.close()
+        return answer
+
+    # Generator of answers (as in A_star.search, plus the weight and the suboptimality bound), one per weight
+    def solutions(self):
+        self.start = time.time()
+        self.pattern_start = self.patterns.hits if self.patterns is not None else 0
+
+        entry = self.table.put(self.initial_state.hash, 0, -1, 0)
+        if self.initial_state.is_goal():
+            self.goal_g, self.goal_entry = 0, entry
+        self.push(self.initial_state, 0, self.evaluator.evaluate(self.initial_state))
+
+        for i, weight in enumerate(self.weights):
+            if i > 0:
+                self.reweight(weight)
+            if not self.improve_path() or self.goal_g is None:
+                return
+
+            path, directions = self.get_path(self.goal_entry)
+            # Parents improved after the goal was reached can make the path cheaper than the goal's g
+            bound = self.bound(weight, len(directions))
+            answer = {}
+            answer['execution_time'] = (time.time() - self.start) * 1000
+            answer['path'] = path
+            answer['directions'] = directions
+            answer['g_n'] = len(directions)
+            answer['weight'] = weight
+            answer['bound'] = bound
+            yield self.finish(answer, "Exito", self.pattern_start)
+            if bound == 1:
+                return
+
+    # Queues the open and inconsistent states again under the new weight and forgets which ones were expanded
+    def reweight(self, weight):
+        items = [item for item in self.priority_queue.items() if self.is_current(item)] + self.incons
+        self.incons = []
+        self.table.reopen()
+        self.priority = weighted_priority(weight)
+        self.priority_queue = BucketQueue()
+        for g, h, state in items:
+            self.push(state, g, h)
+
+    # False for queue items whose state was reached again with a lower g
+    def is_current(self, item):
+        return item[0] == self.table.g[self.table.get(item[2].hash)]
+
+    # One weighted A* iteration. Returns False when the deadline was hit
+    def improve_path(self):
+        while self.priority_queue:
+            if self.deadline is not None and time.time() - self.start > self.deadline:
+                return False
+            priority, (g_n, h_n, current_state) = self.priority_queue.pop()
+            current_entry = self.table.get(current_state.hash)
+            if self.table.is_closed(current_entry) or g_n > self.table.g[current_entry]:
+                continue
+            if self.goal_g is not None and self.goal_g <= priority:
+                self.push(current_state, g_n, h_n)
+                return True
+
+            self.table.close(current_entry)
+
+            children = []
+            for new_state, move, cost in get_successors(current_state, self.map, self.push_level):
+                entry = self.table.get(new_state.hash)
+                if is_deadlocked_push(new_state, move, self.map, self.push_level, self.dead_squares, self.patterns):
+                    self.pruned += 1
+                    continue
+
+                new_g_n = g_n + cost
+                if entry < 0 or new_g_n < self.table.g[entry]:
+                    closed = self.table.is_closed(entry)
+                    direction = move[1] if self.push_level else move
+                    entry = self.table.put(new_state.hash, new_g_n, current_entry, DIRECTION_CODES[direction])
+                    if new_state.is_goal() and (self.goal_g is None or new_g_n < self.goal_g):
+                        self.goal_g, self.goal_entry = new_g_n, entry
+                    children.append((new_state, new_g_n, move, closed))
+
+            h_values = self.evaluator.evaluate_children(current_state, [(new_state, move) for new_state, _, move, _ in children])
+            for (new_state, new_g_n, move, closed), h_n in zip(children, h_values):
+                if not closed:
+                    self.push(new_state, new_g_n, h_n)
+                elif h_n != float('inf'):
+                    self.incons.append((new_g_n, h_n, new_state))
+        return True
+
+    # Suboptimality bound of a solution of the given cost: every cheaper solution goes through an open or
+    # inconsistent state, so the optimum is at least the smallest g + h among them
+    def bound(self, weight, cost):
+        lower = min((g + h for g, h, state in self.priority_queue.items() + self.incons if self.is_current((g, h, state))), default=None)
+        if lower is None or cost <= lower:
+            return 1
+        if lower == 0:
+            return weight
+        return min(weight, cost / lower)
+
+# Transposition table with a fixed number of slots indexed by the state hash, so its memory
+# does not grow with the search. Each slot keeps the g at which the state was expanded and the
+# iteration that expanded it, so IDA* can drop paths that reach it again without a lower g.
+# Replacement policies on collision:
+#   "shallow": keep the entry closer to the root (smaller g) unless it is from an older iteration
+#   "always": the newest entry always wins
+class TranspositionTable:
+    def __init__(self, capacity=1 << 18, policy="shallow"):
+        if policy not in ("shallow", "always"):
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.states = [None] * capacity
+        self.g = [0] * capacity
+        self.iteration = [0] * capacity
+        self.entries = 0
+
+    def get(self, state):
+        slot = state.hash % self.capacity
+        stored = self.states[slot]
+        if stored is None or stored != state:
+            return None
+        return self.g[slot], self.iteration[slot]
+
+    def store(self, state, g, iteration):
+        slot = state.hash % self.capacity
+        stored = self.states[slot]
+        if stored is None:
+            self.entries += 1
+        elif self.policy == "shallow" and stored != state and self.iteration[slot] == iteration and self.g[slot] < g:
+            return
+        self.states[slot] = state
+        self.g[slot] = g
+        self.iteration[slot] = iteration
+
+class IDA_star:
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, push_level=False, table_capacity=1 << 18, table_policy="shallow"):
+        if push_level:
+            initial_state = initial_state.normalized(map)
+        self.initial_state = initial_state
+        self.heuristics = heuristics
+        self.evaluate = bind_heuristic(heuristics, valid_box_positions)
+        self.map = map
+        self.valid_box_positions = valid_box_positions
+        self.push_level = push_level
+        self.table = TranspositionTable(table_capacity, table_policy)
+        self.explored = 0
+        self.iterations = 0
+        # Deepest stack of an iteration, the states IDA* keeps besides the table
+        self.max_depth = 0
+
+    def search(self):
+
+        answer = {}
+        answer['execution_time'] = time.time() # To substract from the end time
+
+        bound = self.evaluate(self.initial_state)
+        while bound != float('inf'):
+            self.iterations += 1
+            result = self.depth_first(bound)
+            if isinstance(result, list):
+                path, directions = self.get_path(result)
+                f = open("data/stats.csv","a")
+                line = f"{self.map.name},IDA*,{self.heuristics.__class__.__name__},{(time.time() - answer['execution_time']) * 1000},{self.explored},{self.max_depth},{len(path)}\n"
+                f.write(line)
+                f.close()
+
+                answer['explored'] = self.explored
+                answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
+                answer['frontier'] = self.max_depth
+                answer['path'] = path
+                answer['directions'] = directions
+                answer['g_n'] = len(directions)
+                answer['iterations'] = self.iterations
+                answer['table_entries'] = self.table.entries
+                answer['result'] = "Exito"
+                return answer
+            bound = result
+
+        print("No path found.")
+        answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
+        answer['path'] = []
+        answer['directions'] = []
+        answer['explored'] = self.explored
+        answer['frontier'] = self.max_depth
+        answer['g_n'] = 0
+        answer['iterations'] = self.iterations
+        answer['table_entries'] = self.table.entries
+        answer['result'] = "Fracaso"
+        return answer
+
+    # One cost-bounded depth-first iteration, with an explicit stack so deep bounds do not hit the recursion limit.
+    # Returns the list of moves to the goal, or the smallest f that exceeded the bound.
+    def depth_first(self, bound):
+        infinity = float('inf')
+        # Frame: [state, g, pending successors, smallest f over the bound, move that reached it]
+        stack = [[self.initial_state, 0, None, infinity, None]]
+        on_path = {self.initial_state}
+        next_bound = infinity
+
+        while stack:
+            frame = stack[-1]
+            state, g, successors, min_f = frame[0], frame[1], frame[2], frame[3]
+
+            if successors is None:
+                h = self.evaluate(state)
+                entry = self.table.get(state)
+                if g + h > bound:
+                    value = g + h
+                elif state.is_goal():
+                    return [frame[4] for frame in stack[1:]]
+                elif entry is not None and entry[1] == self.iterations and entry[0] <= g:
+                    # Already expanded in this iteration with at most this g: that visit had at least as much of
+                    # the bound left, and the f values it went over are already counted in the next bound
+                    value = infinity
+                else:
+                    self.table.store(state, g, self.iterations)
+                    frame[2] = iter(get_successors(state, self.map, self.push_level))
+                    self.explored += 1
+                    self.max_depth = max(self.max_depth, len(stack))
+                    continue
+            else:
+                child = next(successors, None)
+                if child is not None:
+                    new_state, move, cost = child
+                    if new_state not in on_path:
+                        on_path.add(new_state)
+                        stack.append([new_state, g + cost, None, infinity, move])
+                    continue
+                value = min_f
+
+            stack.pop()
+            on_path.discard(state)
+            if stack:
+                stack[-1][3] = min(stack[-1][3], value)
+            else:
+                next_bound = value
+
+        return next_bound
+
+    def get_path(self, moves):
+        directions = expand_pushes(self.initial_state, moves, self.map) if self.push_level else moves
+        return replay_path(self.initial_state, directions, self.map), directions
+
+# Runs every A* heuristic on every map, sharded across worker processes (see batch.py)
+def run_a_10_times(workers=None):
+    from batch import run_batch
+    return run_batch(algorithms=["astar"], repetitions=10, workers=workers)
 
-def load_map(map_file):
-    with open(map_file, "r") as f:
-        return [list(line.strip()) for line in f.readlines()]
-    
 def execute_a(a_star):
     answer = a_star.search()
 
@@ -214,65 +986,127 @@ def main():
 if __name__ == "__main__":
     main()
 
-def get_astar(data_map, heuristic, valid_box_positions):
-    map = MapInfo(load_map(data_map), "")
+def get_astar(data_map, heuristic, valid_box_positions, push_level=False, lazy=False):
+    map = compile_map(data_map, "")
 
     manhattan_distance = ManhattanDistance(map.targets)
     manhattan_improved = ManhattanImproved(map.targets)
-    manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets)
-    manhattam_with_corral_deadlock_detection = ManhattanDistanceWithCorralDeadlockDetection(map.targets,map.walls)
+    manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets, map.walls, map)
+    manhattam_with_corral_deadlock_detection = ManhattanDistanceWithCorralDeadlockDetection(map.targets, map.walls, map)
     player_distance = PlayerDistance(map.targets)
     combined_heuristic = CombinedHeuristic(map.targets)
-    combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets)
+    combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets, map.walls, map)
 
-    initial_state = State(map.boxes, map.player, map.targets)
+    initial_state = State.from_map(map)
 
    
     if heuristic == "manhattan_distance":
         print("AStar - Manhattan Distance")
-        a_star_manhattan = A_star(initial_state, manhattan_distance, map, valid_box_positions)
+        a_star_manhattan = A_star(initial_state, manhattan_distance, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_manhattan)
         write_output("AStar_combined", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "manhattan_improved":
         print("AStar - Manhattan Improved")
-        a_star_manhattan_improved = A_star(initial_state, manhattan_improved, map, valid_box_positions)
+        a_star_manhattan_improved = A_star(initial_state, manhattan_improved, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_manhattan_improved)
         write_output("AStar_manhattan_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "manhattan_with_deadlock_detection":
         print("AStar - Manhattan With Deadlock Detection")
-        a_star_manhattan_deadlock= A_star(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions)
+        a_star_manhattan_deadlock= A_star(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_manhattan_deadlock)
         write_output("AStar_manhattan_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
     
     if heuristic == "player_distance":
         print("AStar - Player Distance")
-        a_star_player_distance = A_star(initial_state, player_distance, map, valid_box_positions)
+        a_star_player_distance = A_star(initial_state, player_distance, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_player_distance)
         write_output("AStar_player_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "combined":
         print("AStar - Combined")
-        a_star_combined = A_star(initial_state, combined_heuristic, map, valid_box_positions)
+        a_star_combined = A_star(initial_state, combined_heuristic, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_combined)
         write_output("AStar_combined", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "combined_with_deadlock_detection":
         print("AStar - Combined With Deadlock Detection")
-        a_star_combined_deadlock = A_star(initial_state, combined_heuristic_with_deadlock_detection , map, valid_box_positions)
+        a_star_combined_deadlock = A_star(initial_state, combined_heuristic_with_deadlock_detection , map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_combined_deadlock)
         write_output("AStar_combined_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
         
     if heuristic == "manhattan_with_corral_deadlock_detection":
         print("AStar - Manhattan With Corral Deadlock Detection")
-        a_star_manhattan_corral_deadlock = A_star(initial_state, manhattam_with_corral_deadlock_detection, map, valid_box_positions)
+        a_star_manhattan_corral_deadlock = A_star(initial_state, manhattam_with_corral_deadlock_detection, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_a(a_star_manhattan_corral_deadlock)
         write_output("AStar_combined_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
+
+    if heuristic == "push_distance":
+        print("AStar - Push Distance")
+        a_star_push_distance = A_star(initial_state, PushDistance(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_a(a_star_push_distance)
+        write_output("AStar_push_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
+    if heuristic == "push_distance_improved":
+        print("AStar - Push Distance Improved")
+        a_star_push_distance_improved = A_star(initial_state, PushDistanceImproved(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_a(a_star_push_distance_improved)
+        write_output("AStar_push_distance_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
+    if heuristic == "pattern_database":
+        print("AStar - Pattern Database")
+        a_star_pattern_database = A_star(initial_state, PatternDatabaseHeuristic(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_a(a_star_pattern_database)
+        write_output("AStar_pattern_database", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
+def get_idastar(data_map, heuristic, valid_box_positions, push_level=False, table_capacity=1 << 18, table_policy="shallow"):
+    map = compile_map(data_map, "")
+
+    initial_state = State.from_map(map)
+
+    print(f"IDA* - {heuristic}")
+    ida_star = IDA_star(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, push_level, table_capacity, table_policy)
+    answer = execute_a(ida_star)
+    write_output(f"IDAStar_{heuristic}", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
+
+# Weighted A*: with an admissible heuristic the solution costs at most `weight` times the optimum
+def get_weighted_astar(data_map, heuristic, valid_box_positions, weight=2, push_level=False, lazy=False):
+    map = compile_map(data_map, "")
+
+    initial_state = State.from_map(map)
+
+    print(f"WA* ({weight}) - {heuristic}")
+    weighted_a_star = WeightedA_star(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, weight, push_level, lazy=lazy)
+    answer = execute_a(weighted_a_star)
+    write_output(f"WAStar_{heuristic}", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
+
+# ARA*: weighted A* solutions of decreasing weight, each one passed to callback as soon as it is found.
+# deadline (seconds) stops the search with the best solution so far
+def get_arastar(data_map, heuristic, valid_box_positions, weights=(5, 3, 2, 1.5, 1.25, 1), deadline=None, push_level=False, callback=None):
+    map = compile_map(data_map, "")
+
+    initial_state = State.from_map(map)
+
+    print(f"ARA* - {heuristic}")
+    ara_star = ARA_star(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, weights, deadline, push_level)
+    answer = ara_star.search(callback)
+    print(f"Execution time: {answer['execution_time']}")
+    print(f"Nodes explored: {answer['explored']}")
+    print(f"Path length: {len(answer['path'])}")
+    print(f"Bound: {answer['bound']}")
+    print("-----")
+    write_output(f"ARAStar_{heuristic}", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
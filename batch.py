@@ -0,0 +1,145 @@
+import csv
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from portfolio import solve
+from map import compile_map
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: jobs run without a memory limit
+    resource = None
+
+DEFAULT_HEURISTICS = [
+    "manhattan_distance",
+    "manhattan_improved",
+    "player_distance",
+    "combined",
+    "manhattan_with_deadlock_detection",
+    "combined_with_deadlock_detection",
+]
+
+RESULT_COLUMNS = ['map', 'algorithm', 'heuristic', 'repetition', 'result', 'execution_time', 'explored', 'frontier', 'path_length']
+
+# Full job matrix: map x algorithm x heuristic x repetition. BFS/DFS do not use heuristics.
+def build_jobs(maps, algorithms, heuristics, repetitions):
+    jobs = []
+    for map_file in maps:
+        for algorithm in algorithms:
+            for heuristic in (heuristics if algorithm in ("astar", "greedy", "beam", "ehc") else [None]):
+                for repetition in range(repetitions):
+                    jobs.append((map_file, algorithm, heuristic, repetition))
+    return jobs
+
+def job_row(job):
+    map_file, algorithm, heuristic, repetition = job
+    return {'map': os.path.basename(map_file), 'algorithm': algorithm, 'heuristic': heuristic, 'repetition': repetition}
+
+# Virtual memory already mapped by the worker (interpreter, numpy, scipy...), 0 where /proc is not available
+def memory_in_use():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+# The row goes back through a pipe created before the job started: unlike a Queue it needs no feeder
+# thread, which could not be started once the job is over its memory limit
+def run_batch_job(job, valid_box_positions, push_level, memory_limit, connection):
+    map_file, algorithm, heuristic, repetition = job
+    row = job_row(job)
+    if memory_limit is not None and resource is not None:
+        # The limit is on top of what the worker already uses after its imports
+        limit = memory_in_use() + memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        answer = solve(map_file, algorithm, heuristic, valid_box_positions, push_level)
+        row['result'] = answer['result']
+        row['execution_time'] = answer['execution_time']
+        row['explored'] = answer.get('explored')
+        row['frontier'] = answer.get('frontier')
+        row['path_length'] = len(answer['path'])
+    except MemoryError:
+        row['result'] = "MemoryLimit"
+    connection.send(row)
+    connection.close()
+
+# Runs the whole job matrix across worker processes (one process per job, at most `workers` at a
+# time) and gathers one row per job. time_limit is in seconds per job and memory_limit in MB per job
+# (besides the memory used by the imported modules); jobs over their limit are recorded as Timeout /
+# MemoryLimit. A fresh process per job instead of a multiprocessing.Pool is what makes both limits
+# possible: a job over its time is stopped by terminating its process, and RLIMIT_AS applies to a
+# whole process.
+# The solvers keep appending their own lines to data/stats.csv, the table with every job
+# (including the failed ones) is written to `output`.
+def run_batch(maps=None, algorithms=("astar", "greedy", "bfs", "dfs"), heuristics=DEFAULT_HEURISTICS, repetitions=10, workers=None, time_limit=None, memory_limit=None, push_level=False, output='data/batch_results.csv'):
+    if 'stats.csv' not in os.listdir('data'):
+        file = open('data/stats.csv', 'w')
+        file.write('map,algorithm,heuristic,execution_time,explored,frontier,path_length\n')
+        file.close()
+
+    if maps is None:
+        maps = [f"maps/{m}" for m in sorted(os.listdir('maps'))]
+    workers = workers or os.cpu_count()
+
+    # Maps are compiled (or loaded from the compiled cache) once here, so the jobs only load them
+    valid_box_positions = {}
+    for map_file in maps:
+        valid_box_positions[map_file] = compile_map(map_file, map_file).valid_box_positions
+
+    jobs = build_jobs(maps, algorithms, heuristics, repetitions)
+    rows = [None] * len(jobs)
+    pending = list(enumerate(jobs))
+    running = {}
+
+    while pending or running:
+        while pending and len(running) < workers:
+            index, job = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_batch_job, args=(job, valid_box_positions[job[0]], push_level, memory_limit, sender), daemon=True)
+            process.start()
+            # Only the worker keeps the sending end, so the pipe reports EOF if it dies without a row
+            sender.close()
+            running[index] = (process, receiver, time.time())
+
+        ready = wait([receiver for _, receiver, _ in running.values()], timeout=0.1)
+        for index, (process, receiver, _) in list(running.items()):
+            if receiver not in ready:
+                continue
+            try:
+                row = receiver.recv()
+            except EOFError:
+                # Died without sending its row
+                row = dict(job_row(jobs[index]), result="Error")
+            running.pop(index)
+            process.join()
+            receiver.close()
+            rows[index] = row
+            print(f"{row['map']} - {row['algorithm']} {row['heuristic'] or ''} #{row['repetition']}: {row['result']}")
+
+        for index, (process, receiver, started) in list(running.items()):
+            timed_out = time_limit is not None and time.time() - started > time_limit
+            if timed_out:
+                process.terminate()
+                process.join()
+            if timed_out or (not process.is_alive() and process.exitcode != 0):
+                running.pop(index)
+                receiver.close()
+                row = dict(job_row(jobs[index]), result="Timeout" if timed_out else "Error")
+                rows[index] = row
+                print(f"{row['map']} - {row['algorithm']} {row['heuristic'] or ''} #{row['repetition']}: {row['result']}")
+
+    if output:
+        with open(output, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+def main():
+    run_batch()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import time
+from a_star import State, DIRECTIONS, expand_pushes, replay_path, execute_a
+from generate_outputs import write_output
+from map import compile_map
+
+# Every solved state: boxes on all goals with the player in any region next to a box
+def get_goal_states(map):
+    box_cells = [map.index(goal) for goal in map.targets]
+    covered = set()
+    goal_states = []
+    for box_cell in box_cells:
+        for direction in DIRECTIONS:
+            cell = box_cell + map.offset(direction)
+            if cell in covered or map.wall_cells[cell] or cell in box_cells:
+                continue
+            state = State.from_cells(map, box_cells, cell).normalized(map)
+            region = state.player_region(map)[0]
+            covered.update(reachable_cell for reachable_cell in range(map.size) if region[reachable_cell])
+            goal_states.append(state)
+    return goal_states
+
+# Bidirectional push-level search: a forward search of pushes from the start and a backward search of
+# pulls from every solved state, expanding the smaller frontier one layer at a time until both meet
+class Bidirectional:
+    def __init__(self, initial_state, map, valid_box_positions):
+        self.initial_state = initial_state.normalized(map)
+        self.map = map
+        # Cells from which a box can still reach a goal; forward pushes elsewhere are dead ends
+        self.valid_box_cells = {map.index(position) for position in valid_box_positions}
+        # state -> (neighbour towards the start/goal, push between them)
+        self.forward_parent = {self.initial_state: None}
+        self.backward_parent = {}
+        self.explored_forward = 0
+        self.explored_backward = 0
+
+    def search(self):
+
+        answer = {}
+        answer['execution_time'] = time.time() # To substract from the end time
+
+        forward_frontier = [self.initial_state]
+        backward_frontier = get_goal_states(self.map)
+        for state in backward_frontier:
+            self.backward_parent[state] = None
+
+        meeting = self.initial_state if self.initial_state in self.backward_parent else None
+        while meeting is None and forward_frontier and backward_frontier:
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meeting = self.expand_forward(forward_frontier)
+            else:
+                backward_frontier, meeting = self.expand_backward(backward_frontier)
+
+        explored = self.explored_forward + self.explored_backward
+        frontier = len(self.forward_parent) + len(self.backward_parent)
+
+        if meeting is None:
+            print("No path found.")
+            answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
+            answer['path'] = []
+            answer['directions'] = []
+            answer['explored'] = explored
+            answer['frontier'] = frontier
+            answer['g_n'] = 0
+            answer['result'] = "Fracaso"
+            return answer
+
+        path, directions = self.get_path(meeting)
+        f = open("data/stats.csv","a")
+        line = f"{self.map.name},Bidirectional,None,{(time.time() - answer['execution_time']) * 1000},{explored},{frontier},{len(path)}\n"
+        f.write(line)
+        f.close()
+
+        answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
+        answer['path'] = path
+        answer['directions'] = directions
+        answer['explored'] = explored
+        answer['explored_forward'] = self.explored_forward
+        answer['explored_backward'] = self.explored_backward
+        answer['frontier'] = frontier
+        answer['g_n'] = len(directions)
+        answer['result'] = "Exito"
+        return answer
+
+    def expand_forward(self, frontier):
+        next_frontier = []
+        for state in frontier:
+            self.explored_forward += 1
+            for child, push, _ in state.pushes(self.map):
+                if push[0] + self.map.offset(push[1]) not in self.valid_box_cells or child in self.forward_parent:
+                    continue
+                self.forward_parent[child] = (state, push)
+                if child in self.backward_parent:
+                    return next_frontier, child
+                next_frontier.append(child)
+        return next_frontier, None
+
+    def expand_backward(self, frontier):
+        next_frontier = []
+        for state in frontier:
+            self.explored_backward += 1
+            for child, push, _ in state.pulls(self.map):
+                if child in self.backward_parent:
+                    continue
+                self.backward_parent[child] = (state, push)
+                if child in self.forward_parent:
+                    return next_frontier, child
+                next_frontier.append(child)
+        return next_frontier, None
+
+    def get_path(self, meeting):
+        pushes = []
+
+        # From the meeting state back to the start...
+        state = meeting
+        while self.forward_parent[state] is not None:
+            state, push = self.forward_parent[state]
+            pushes.append(push)
+        pushes.reverse()
+
+        # ...and from the meeting state on to a solved state
+        state = meeting
+        while self.backward_parent[state] is not None:
+            state, push = self.backward_parent[state]
+            pushes.append(push)
+
+        directions = expand_pushes(self.initial_state, pushes, self.map)
+        return replay_path(self.initial_state, directions, self.map), directions
+
+def get_bidirectional(data_map, valid_box_positions):
+    map = compile_map(data_map, "")
+    initial_state = State.from_map(map)
+
+    print("Bidirectional - Push/Pull")
+    bidirectional = Bidirectional(initial_state, map, valid_box_positions)
+    answer = execute_a(bidirectional)
+    write_output("Bidirectional", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
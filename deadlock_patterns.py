@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+from collections import deque
+from deadlocks import get_dead_squares, CORRAL_SEARCH_NODES
+from map import atomic_write
+
+PATTERN_DIRECTORY = 'data/deadlock_patterns'
+# Largest side of a pattern window, bigger corrals are not learned
+PATTERN_MAX_SIZE = 6
+
+# Cell codes inside a pattern window: the content of the cell plus flags
+FLOOR = 0
+WALL = 1
+BOX = 2
+GOAL = 4
+DEAD = 8
+
+LOCAL_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+# Store of deadlock patterns learned on a map: windows of boxes, walls, goals and dead squares that were proved
+# to be a deadlock whatever the rest of the map looks like. Patterns are kept in a canonical form under the
+# 8 rotations/reflections and all their variants are indexed by (window size, position of one of its boxes),
+# so a state is checked by reading the window around the box that was just pushed and looking it up.
+# Learned patterns are saved per map in PATTERN_DIRECTORY and loaded back by later runs.
+class DeadlockPatterns:
+    def __init__(self, map, path=None):
+        self.map = map
+        self.dead_squares = get_dead_squares(map)
+        self.path = path or os.path.join(PATTERN_DIRECTORY, hashlib.sha1(map.layout.encode()).hexdigest()[:16] + '.json')
+        # Canonical patterns as (height, width, codes)
+        self.patterns = set()
+        # (height, width, box row, box column) -> {codes: enclosed cells as (row, column)}
+        self.index = {}
+        self.hits = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            for height, width, codes in json.load(file):
+                self.add(height, width, tuple(codes))
+        self.dirty = False
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        patterns = sorted([height, width, list(codes)] for height, width, codes in self.patterns)
+        atomic_write(self.path, lambda file: json.dump(patterns, file), 'w')
+        self.dirty = False
+
+    def add(self, height, width, codes):
+        variants = get_variants(height, width, codes)
+        canonical = min(variants)
+        if canonical in self.patterns:
+            return
+        self.patterns.add(canonical)
+        self.dirty = True
+        for variant_height, variant_width, variant_codes in variants:
+            enclosed = get_enclosed_cells(variant_height, variant_width, variant_codes)
+            for i, code in enumerate(variant_codes):
+                if code & 3 == BOX:
+                    key = (variant_height, variant_width, i // variant_width, i % variant_width)
+                    self.index.setdefault(key, {})[variant_codes] = enclosed
+
+    # Code of a map cell, walls outside the map
+    def cell_code(self, x, y, box_set):
+        map = self.map
+        if x < 0 or y < 0 or x >= map.height or y >= map.width:
+            return WALL
+        cell = x * map.width + y
+        if map.wall_cells[cell]:
+            return WALL
+        code = BOX if cell in box_set else FLOOR
+        if map.goal_cells[cell]:
+            code |= GOAL
+        if self.dead_squares[cell]:
+            code |= DEAD
+        return code
+
+    def window(self, top, left, height, width, box_set):
+        return tuple(self.cell_code(x, y, box_set) for x in range(top, top + height) for y in range(left, left + width))
+
+    # Called with a corral proved to be a deadlock (cells and boxes as flattened indices): its window with a
+    # ring of one cell around it is stored if the deadlock also holds with the player free outside the window
+    def learn(self, corral, corral_boxes):
+        positions = [self.map.position(cell) for cell in corral | set(corral_boxes)]
+        top = min(x for x, _ in positions) - 1
+        left = min(y for _, y in positions) - 1
+        height = max(x for x, _ in positions) - top + 2
+        width = max(y for _, y in positions) - left + 2
+        if max(height, width) > PATTERN_MAX_SIZE:
+            return
+        codes = self.window(top, left, height, width, set(corral_boxes))
+        if prove_deadlock_pattern(height, width, codes):
+            self.add(height, width, codes)
+
+    # True when the window around box_cell (the box just pushed) matches a learned pattern and the player
+    # cannot get into the part of the window the pattern keeps closed
+    def matches(self, state, box_cell):
+        if not self.index:
+            return False
+        x, y = self.map.position(box_cell)
+        box_set = set(state.box_cells)
+        for (height, width, row, column), patterns in self.index.items():
+            top = x - row
+            left = y - column
+            enclosed = patterns.get(self.window(top, left, height, width, box_set))
+            if enclosed is None:
+                continue
+            region = state.player_region(self.map)[0]
+            if any(region[(top + i) * self.map.width + left + j] for i, j in enclosed):
+                continue
+            self.hits += 1
+            return True
+        return False
+
+# Computed once per map and kept on the MapInfo
+def get_deadlock_patterns(map):
+    if map.deadlock_patterns is None:
+        map.deadlock_patterns = DeadlockPatterns(map)
+    return map.deadlock_patterns
+
+# The 8 rotations/reflections of a window
+def get_variants(height, width, codes):
+    rows = [codes[i * width:(i + 1) * width] for i in range(height)]
+    variants = []
+    for grid in (rows, [row[::-1] for row in rows]):
+        for _ in range(4):
+            variants.append((len(grid), len(grid[0]), tuple(code for row in grid for code in row)))
+            # Rotate 90 degrees clockwise
+            grid = [tuple(grid[len(grid) - 1 - i][j] for i in range(len(grid))) for j in range(len(grid[0]))]
+    return variants
+
+# Free cells of the window a player coming from outside it cannot walk to, as (row, column)
+def get_enclosed_cells(height, width, codes):
+    reachable = get_local_region(height, width, codes, {i for i, code in enumerate(codes) if code & 3 == BOX})
+    return tuple(divmod(i, width) for i, code in enumerate(codes) if code & 3 == FLOOR and i not in reachable)
+
+# Cells of the window the player reaches from outside it, with the boxes at the given indices
+def get_local_region(height, width, codes, boxes):
+    region = set()
+    frontier = deque()
+    for i in range(height * width):
+        row, column = divmod(i, width)
+        on_border = row == 0 or column == 0 or row == height - 1 or column == width - 1
+        if on_border and codes[i] & 3 != WALL and i not in boxes:
+            region.add(i)
+            frontier.append(i)
+    while frontier:
+        row, column = divmod(frontier.popleft(), width)
+        for dx, dy in LOCAL_DIRECTIONS:
+            next_row, next_column = row + dx, column + dy
+            if not (0 <= next_row < height and 0 <= next_column < width):
+                continue
+            next_i = next_row * width + next_column
+            if next_i in region or codes[next_i] & 3 == WALL or next_i in boxes:
+                continue
+            region.add(next_i)
+            frontier.append(next_i)
+    return region
+
+# Push-only search inside the window with the player free everywhere outside it. The pattern is a deadlock when
+# no sequence of pushes lets the player into an enclosed cell, takes a box out of the enclosed area or puts
+# every box on a goal. Running out of CORRAL_SEARCH_NODES counts as no deadlock.
+def prove_deadlock_pattern(height, width, codes):
+    start = tuple(i for i, code in enumerate(codes) if code & 3 == BOX)
+    enclosed = {row * width + column for row, column in get_enclosed_cells(height, width, codes)}
+    area = enclosed | set(start)
+    frontier = deque([start])
+    seen = {start}
+    while frontier:
+        boxes = frontier.popleft()
+        box_set = set(boxes)
+        if all(codes[i] & GOAL for i in boxes):
+            return False
+        region = get_local_region(height, width, codes, box_set)
+        if not region.isdisjoint(enclosed):
+            return False
+
+        for i in boxes:
+            row, column = divmod(i, width)
+            for dx, dy in LOCAL_DIRECTIONS:
+                stand_row, stand_column = row - dx, column - dy
+                target_row, target_column = row + dx, column + dy
+                # Standing outside the window is always possible
+                outside = not (0 <= stand_row < height and 0 <= stand_column < width)
+                if not outside and stand_row * width + stand_column not in region:
+                    continue
+                if not (0 <= target_row < height and 0 <= target_column < width):
+                    return False
+                target = target_row * width + target_column
+                if codes[target] & 3 == WALL or target in box_set or codes[target] & DEAD:
+                    continue
+                if target not in area:
+                    return False
+                new_boxes = tuple(sorted(box if box != i else target for box in boxes))
+                if new_boxes not in seen:
+                    if len(seen) >= CORRAL_SEARCH_NODES:
+                        return False
+                    seen.add(new_boxes)
+                    frontier.append(new_boxes)
+    return True
@@ -1,234 +1,278 @@
-from uninformative_searchs import Uninformed_State
-from uninformative_searchs import Node
-from uninformative_searchs import uninformed_search_algorithm
-from uninformative_searchs import is_goal
-from uninformative_searchs import get_children
-
 #from game_solver import *
-from functools import partial
+from collections import deque
+
+PULL_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+# Most push configurations explored when checking a single corral
+CORRAL_SEARCH_NODES = 500
 
 # For deadlocks -> move to heuristics
+# Every position from which a box can still be pushed to some goal, as [x, y] lists: a BFS of pulls from
+# each goal. Explored positions and walls are kept in sets so the whole preprocessing is linear in the map.
 def load_all_playable_positions_for_boxes(goals, walls):
     valid_box_positions = []
-    
+    found = set()
+    wall_set = {(wall[0], wall[1]) for wall in walls}
+
     # Iterate through each goal square
     for goal in goals:
-        # Create a set to track explored positions during pulling
-        explored = []
-        frontier = [[goal[0], goal[1]]]
-        explored.append([goal[0], goal[1]])
-        
-        # Directions for pulling (opposite of pushing)
-        directions = [
-            [1, 0],   # Down to Up
-            [-1, 0],  # Up to Down
-            [0, 1],   # Right to Left
-            [0, -1]   # Left to Right
-        ]
-
-        wall_list = []
-        for wall in walls:
-            wall_list.append([wall[0],wall[1]])
-        
+        explored = {(goal[0], goal[1])}
+        explored_order = [(goal[0], goal[1])]
+        frontier = deque([(goal[0], goal[1])])
+
         # Breadth-first search to pull the box
         while frontier:
-            current_position = frontier.pop(0)
-            
+            current_position = frontier.popleft()
+
             # Try pulling from each direction
-            for direction in directions:
-                # Calculate the box position before pulling
-                box_position = [
-                    current_position[0] - direction[0], 
-                    current_position[1] - direction[1]
-                ]
-                
-                # Calculate the player position that would allow this pull
-                player_position = [
-                    box_position[0] - direction[0], 
-                    box_position[1] - direction[1]
-                ]
-                
-                # Check if the pull is valid:
-                # 1. Box position is not a wall
-                # 2. Player position is not a wall
-                # 3. Box position hasn't been explored before
-                if (box_position not in wall_list and
-                    player_position not in wall_list and 
+            for direction in PULL_DIRECTIONS:
+                # Box position before pulling and the player position that would allow this pull
+                box_position = (current_position[0] - direction[0], current_position[1] - direction[1])
+                player_position = (box_position[0] - direction[0], box_position[1] - direction[1])
+
+                # Check if the pull is valid: neither position is a wall and the box position is new
+                if (box_position not in wall_set and
+                    player_position not in wall_set and
                     box_position not in explored):
-                    
+
                     # Mark this position as explored and add to frontier
-                    explored.append(box_position)
+                    explored.add(box_position)
+                    explored_order.append(box_position)
                     frontier.append(box_position)
-        
+
         # Add all explored positions to valid box positions
-        for pos in explored:
-            if pos not in valid_box_positions:
-                valid_box_positions.append(pos)
-    
+        for position in explored_order:
+            if position not in found:
+                found.add(position)
+                valid_box_positions.append([position[0], position[1]])
+
     return valid_box_positions
 
-def check_simple_deadlock_for_boxes(boxes, valid_box_positions):
+# Dead squares as a bytearray indexed by cell: 1 where a box can never be pushed to any goal (walls included),
+# so the simple deadlock check is a single lookup per box
+def load_dead_squares(map, valid_box_positions=None):
+    if valid_box_positions is None:
+        valid_box_positions = load_all_playable_positions_for_boxes(list(map.targets), list(map.walls))
+    dead_squares = bytearray(b"\x01" * map.size)
+    for position in valid_box_positions:
+        dead_squares[map.index(position)] = 0
+    return dead_squares
+
+# Computed once per map and kept on the MapInfo
+def get_dead_squares(map, valid_box_positions=None):
+    if map.dead_squares is None:
+        map.dead_squares = load_dead_squares(map, valid_box_positions)
+    return map.dead_squares
+
+# Push distances ignoring the other boxes: the same pulls as load_all_playable_positions_for_boxes,
+# but as a BFS from each goal over the flattened grid of the map, counting pulls.
+# Returns (goal_distances, min_distances), both indexed by cell: goal_distances[cell] holds the pushes
+# needed to take a box from cell to each goal (in sorted goal order) and min_distances[cell] the
+# smallest of them. Unreachable entries are inf, so inf in min_distances marks a dead square.
+def load_push_distances(map):
+    infinity = float('inf')
+    per_goal = []
+    for goal in sorted(map.targets):
+        distance = [infinity] * map.size
+        start = map.index(goal)
+        distance[start] = 0
+        frontier = deque([start])
+        while frontier:
+            current_cell = frontier.popleft()
+            for direction in PULL_DIRECTIONS:
+                offset = map.offset(direction)
+                # Box position before the pull and the player position that allows it
+                box_cell = current_cell - offset
+                player_cell = box_cell - offset
+                if map.wall_cells[box_cell] or map.wall_cells[player_cell] or distance[box_cell] != infinity:
+                    continue
+                distance[box_cell] = distance[current_cell] + 1
+                frontier.append(box_cell)
+        per_goal.append(distance)
+
+    goal_distances = [tuple(distance[cell] for distance in per_goal) for cell in range(map.size)]
+    min_distances = [min(distances, default=infinity) for distances in goal_distances]
+    return goal_distances, min_distances
+
+# Computed once per map and kept on the MapInfo
+def get_push_distances(map):
+    if map.push_distances is None:
+        map.push_distances = load_push_distances(map)
+    return map.push_distances
+
+# A box on a dead square can never reach a goal. boxes are (x, y) positions, width is the map's row stride
+def check_simple_deadlock_for_boxes(boxes, dead_squares, width):
     for box in boxes:
-        for valid_box in valid_box_positions:
-            if box[0] == valid_box[0] and box[1] == valid_box[1]:
-                return False     
-    return True
-
-def check_corral_deadlock(walls,goals,player,boxes,box_moved,valid_boxes):
-
-    state = Uninformed_State(boxes,player)
-
-    reachable_positions = []
-    reachable_positions = get_reachable_positions(walls,state)
-
-    # With the reachable positions, we can get the area the player cannot reach (corral)
-    corral = []
-    corral = get_corral(reachable_positions, walls,state,valid_boxes)
-
-    if not box_moved:
-        return False
-
-    if not corral:
-        return False
-
-    # Then delete the boxes that are not in the corral, so we can check if the corral is a deadlock 
-    deleted_boxes_state, deleted_boxes = delete_boxes(corral,state,walls)
-
-    if not valid_corral(deleted_boxes_state,corral,goals):
-        return True
-
-    # Try to get all the boxes in the corral to a goal
-    new_is_goal = partial(is_corral_goal, corral=corral,deleted_boxes=deleted_boxes,walls=walls,goals=goals)
-
-    
-    corral_solution = uninformed_search_algorithm("",goals,walls, deleted_boxes_state, new_is_goal, get_children, None, "bfs")
-
-    # If there is no solution, then the corral is a deadlock
-    # If any of the boxes in the corral is freezed, then the corral is a deadlock
-    if corral_solution == None:
-        return True
-    
-    # If there is a partial solution, then we need to place the boxes we deleted before
-    # If any box exited the corral, then the corral was not a deadlock
-    else:
-        return False        
-    
-
-
-def valid_corral(state,corral,goals):
-
-    goals_in_corral = 0
-    for goal in goals:
-        if inside_corral(corral, goal):
-            goals_in_corral += 1
-
-    if goals_in_corral == len(state.boxes):
-        return True
-    
-    return False
-
-    
-def is_corral_goal(state, game,corral,deleted_boxes,walls,goals):
-
-    if any_box_exit_corral(state, game,corral):
-        return True
-    
-    boxes_placed = 0
-    for box in state.boxes:
-        if tuple(box) in game:
-            boxes_placed += 1
-
-    # If all the boxes inside the corral are placed in a goal, then we have to place the boxes deleted before
-    if boxes_placed == len(state.boxes):
-        for box in deleted_boxes:
-            state.boxes.append(box)
-        state = Uninformed_State(state.boxes, state.player)
-        uninformed_search_algorithm("",goals,walls, state, is_goal, get_children, None, "dfs")
-
-    return False
-
-
-def any_box_exit_corral(state, game,corral):
-
-    for box in state.boxes:
-        if not inside_corral(corral, box):
+        if dead_squares[box[0] * width + box[1]]:
             return True
-
     return False
 
-def delete_boxes(corral, state,game):
-
-    new_state_boxes = []
-    deleted_boxes = []
-
-    for box in state.boxes:
-        new_state_boxes.append(box)
-
-    for box in state.boxes:
-        #if not check_box_freezed(box,state,game):
-            if not inside_corral(corral, box):
-                new_state_boxes.remove(box)
-                deleted_boxes.append(box)
-
-    new_state = Uninformed_State(new_state_boxes, state.player)
-    return new_state, deleted_boxes
-
-
-def inside_corral(corral, box):
-    for position in corral:
-        if box[0] == position[0] and box[1] == position[1]:
+# Freeze deadlock after a push, checked only around the box that was just pushed (box_cell).
+# A box is frozen when it is blocked both horizontally and vertically; an axis is blocked by a wall on either
+# side, by dead squares on both sides, or by a neighbouring box that is frozen itself. The box under test
+# counts as a wall while its neighbours are checked, which ends the recursion.
+# The state is lost when the pushed box is frozen and any box of its frozen group is off goal.
+def check_freeze_deadlock(state, box_cell, map, dead_squares):
+    frozen = []
+    if not is_frozen(state, box_cell, map, dead_squares, set(), frozen):
+        return False
+    for cell in frozen:
+        if not map.goal_cells[cell]:
             return True
     return False
 
+def is_frozen(state, box_cell, map, dead_squares, testing, frozen):
+    testing.add(box_cell)
+    # Boxes found frozen from here on relied on this one being a wall
+    found = len(frozen)
+    for axis in ((0, 1), (1, 0)):
+        offset = map.offset(axis)
+        before = box_cell - offset
+        after = box_cell + offset
+        blocked = (map.wall_cells[before] or map.wall_cells[after] or (dead_squares[before] and dead_squares[after])
+                   or blocked_by_box(state, before, map, dead_squares, testing, frozen)
+                   or blocked_by_box(state, after, map, dead_squares, testing, frozen))
+        if not blocked:
+            testing.discard(box_cell)
+            del frozen[found:]
+            return False
+    frozen.append(box_cell)
+    return True
 
-def get_corral(reachable_positions, game, state,valid_boxes):
-    corral = set()
-    for position in valid_boxes:
-        if tuple(position) not in reachable_positions and position not in state.boxes:
-            corral.add(tuple(position))
-    
-    return get_adyacent(corral,game)
-
-
-def get_adyacent(reachable_positions,walls):
-    corral = set(reachable_positions)
-    directions= [[- 1, 0], [0, 1], [1, 0], [0, -1]]
-
-    for x,y in reachable_positions:
-        for dx,dy in directions:
-            if (x+dx,y+dy) not in reachable_positions and (x+dx,y+dy) in walls:
-                corral.add((x+dx,y+dy))
-
-    return corral
-
-
-def get_reachable_positions(walls,state):
-
-    frontier = []
-    reachable_positions = []
+def blocked_by_box(state, cell, map, dead_squares, testing, frozen):
+    if cell in testing:
+        return True
+    return state.has_box(cell) and is_frozen(state, cell, map, dead_squares, testing, frozen)
+
+# Flood fill of the cells the player can walk to from player_cell without pushing any box in box_set,
+# over the neighbour tables of the map. Returns a bytearray indexed by cell (1 = reachable) and the smallest
+# reachable cell, which identifies the region. Linear in the size of the region.
+def reachable_mask(map, player_cell, box_set):
+    reachable = bytearray(map.size)
+    reachable[player_cell] = 1
+    canonical = player_cell
+    stack = [player_cell]
+    neighbors = map.neighbors
+    while stack:
+        cell = stack.pop()
+        for next_cell in neighbors[cell]:
+            if not reachable[next_cell] and next_cell not in box_set:
+                reachable[next_cell] = 1
+                if next_cell < canonical:
+                    canonical = next_cell
+                stack.append(next_cell)
+    return reachable, canonical
+
+# Same flood fill as a set of cells, for the (small) areas of corrals
+def reachable_cells(map, start, box_set):
+    region = {start}
+    stack = [start]
+    neighbors = map.neighbors
+    while stack:
+        cell = stack.pop()
+        for next_cell in neighbors[cell]:
+            if next_cell not in region and next_cell not in box_set:
+                region.add(next_cell)
+                stack.append(next_cell)
+    return region
+
+# Corral deadlocks. A corral is an area the player cannot reach, closed by walls and boxes.
+# Only PI-corrals are analysed: every box on the corral barrier touches the player region (P) and every push
+# the player can make on them moves the box into the corral (I), so the player has to deal with that corral
+# before anything else. Each one gets a bounded push-only search with just its own boxes, and a corral is a
+# deadlock when no sequence of pushes opens it, takes a box out of it or puts all of its boxes on goals.
+# Cells are flattened indices; verdicts is a cache with get/put keyed by (corral boxes, corral cells).
+# region is the reachable bytearray of the player when the caller already has it (see reachable_mask).
+# New deadlocks are passed on to patterns.learn when a pattern store is given (see deadlock_patterns.py).
+def check_corral_deadlock(map, box_cells, player_cell, dead_squares, verdicts, max_nodes=CORRAL_SEARCH_NODES, region=None, patterns=None):
+    box_set = set(box_cells)
+    if region is None:
+        region = reachable_mask(map, player_cell, box_set)[0]
+    assigned = set()
+
+    for box_cell in box_cells:
+        for direction in PULL_DIRECTIONS:
+            start = box_cell + map.offset(direction)
+            if region[start] or start in assigned or start in box_set or map.wall_cells[start]:
+                continue
+            corral = reachable_cells(map, start, box_set)
+            assigned |= corral
+
+            corral_boxes = get_corral_boxes(map, corral, box_set)
+            if not is_pi_corral(map, corral, corral_boxes, region, box_set):
+                continue
+            if all(map.goal_cells[cell] for cell in corral_boxes):
+                continue
+
+            key = (tuple(sorted(corral_boxes)), frozenset(corral))
+            deadlock = verdicts.get(key)
+            if deadlock is None:
+                deadlock = search_corral(map, key[0], player_cell, corral, dead_squares, max_nodes)
+                verdicts.put(key, deadlock)
+                if deadlock and patterns is not None:
+                    patterns.learn(corral, corral_boxes)
+            if deadlock:
+                return True
+    return False
 
-    initial_node = Node (state)
-    frontier.append(initial_node)
+# Boxes on the barrier of the corral (next to one of its cells)
+def get_corral_boxes(map, corral, box_set):
+    corral_boxes = set()
+    for cell in corral:
+        for direction in PULL_DIRECTIONS:
+            next_cell = cell + map.offset(direction)
+            if next_cell in box_set:
+                corral_boxes.add(next_cell)
+    return corral_boxes
+
+def is_pi_corral(map, corral, corral_boxes, region, box_set):
+    for box_cell in corral_boxes:
+        touches_region = False
+        for direction in PULL_DIRECTIONS:
+            offset = map.offset(direction)
+            if not region[box_cell - offset]:
+                continue
+            touches_region = True
+            target = box_cell + offset
+            # A push that is possible and leaves the box outside the corral
+            if not map.wall_cells[target] and target not in box_set and target not in corral:
+                return False
+        if not touches_region:
+            return False
+    return True
 
+# Breadth-first search of pushes with only the corral boxes on the map. Returns True (deadlock) when every
+# reachable configuration keeps the corral closed; running out of max_nodes counts as no deadlock.
+def search_corral(map, corral_boxes, player_cell, corral, dead_squares, max_nodes):
+    area = corral | set(corral_boxes)
+    frontier = deque([(corral_boxes, player_cell)])
+    seen = set()
     while frontier:
-        for frontier_node in frontier:
-            for move, child_state, cost, boxed_moved, depth in get_children(frontier_node, walls):
-            
-                if boxed_moved:
+        boxes, player_cell = frontier.popleft()
+        box_set = set(boxes)
+        region, canonical = reachable_mask(map, player_cell, box_set)
+        key = (boxes, canonical)
+        if key in seen:
+            continue
+        seen.add(key)
+        if len(seen) > max_nodes:
+            return False
+
+        if all(map.goal_cells[cell] for cell in boxes):
+            return False
+        # The player got into the corral
+        if any(region[cell] for cell in corral):
+            return False
+
+        for box_cell in boxes:
+            for direction in PULL_DIRECTIONS:
+                offset = map.offset(direction)
+                target = box_cell + offset
+                if not region[box_cell - offset] or map.wall_cells[target] or target in box_set or dead_squares[target]:
                     continue
-
-                child_node = Node(child_state, frontier_node, move, cost, boxed_moved, depth)
-                
-                if any(n.state.player == child_state.player for n in frontier):
-                    continue
-
-                if tuple(child_state.player) not in reachable_positions:
-                    frontier.append(child_node)
-    
-            reachable_positions.append(tuple(frontier_node.state.player))
-            frontier.remove(frontier_node)
-            array = []
-            for f in frontier:
-                array.append(f.state.player)
-    
-    return reachable_positions
\ No newline at end of file
+                # A box left the corral
+                if target not in area:
+                    return False
+                new_boxes = tuple(sorted(cell if cell != box_cell else target for cell in boxes))
+                frontier.append((new_boxes, box_cell))
+    return True
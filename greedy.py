@@ -1,118 +1,135 @@
+from heuristics import ManhattanDistance, ManhattanImproved, PlayerDistance, CombinedHeuristic, ManhattanDistanceWithDeadlockDetection, CombinedHeuristicWithDeadlockDetection,ManhattanDistanceWithCorralDeadlockDetection, PushDistance, PushDistanceImproved, PatternDatabaseHeuristic
 import heapq
-from heuristics import ManhattanDistance, ManhattanImproved, PlayerDistance, CombinedHeuristic, ManhattanDistanceWithDeadlockDetection, CombinedHeuristicWithDeadlockDetection,ManhattanDistanceWithCorralDeadlockDetection
-from a_star import State
-from deadlocks import load_all_playable_positions_for_boxes
+from a_star import State, BestFirstSearch, Evaluator, greedy_priority, get_successors, expand_pushes, replay_path, is_deadlocked_push
+from heuristics import build_heuristic
+from deadlocks import get_dead_squares
+from deadlock_patterns import get_deadlock_patterns
 import time
 import os 
 from generate_outputs import write_output, write_output_for_visualization
-from map import MapInfo
-
-class Greedy:
-
-    def __init__(self, initial_state, heuristics, map, valid_box_positions,box_moved=False):
+from map import compile_map
+
+# Best-first search on h alone, ties broken by the lowest g (see a_star.BestFirstSearch)
+class Greedy(BestFirstSearch):
+    algorithm = "Greedy"
+
+    # box_moved is kept for old callers: the corral heuristic reads it from every child state
+    def __init__(self, initial_state, heuristics, map, valid_box_positions,box_moved=False, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True, lazy=False):
+        super().__init__(initial_state, heuristics, map, valid_box_positions, greedy_priority, push_level, use_cache, freeze_deadlocks, deadlock_patterns, lazy)
+
+# Beam search: Greedy restricted to the beam_width states with the lowest h of each depth layer (one move, or one
+# push in push-level mode, per layer). Memory and time per layer are bounded by the width: only the current layer,
+# the keys of the states admitted to some layer and the moves that led to them (a linked list shared by siblings)
+# are kept. When a layer runs out, the search restarts up to `restarts` times with a beam `widening` times wider.
+class BeamSearch:
+    algorithm = "Beam"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, beam_width=100, restarts=2, widening=4, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True):
+        if push_level:
+            initial_state = initial_state.normalized(map)
         self.initial_state = initial_state
         self.heuristics = heuristics
-        self.explored = set()
-        self.priority_queue = []
-        self.parent = {}
         self.map = map
-        self.best_heuristic = {}
-        self.frontier = set()
-        self.valid_box_positions = valid_box_positions
-        self.box_moved = box_moved
+        self.push_level = push_level
+        self.beam_width = beam_width
+        self.restarts = restarts
+        self.widening = widening
+        self.evaluator = Evaluator(heuristics, map, valid_box_positions, push_level, use_cache)
+        self.dead_squares = get_dead_squares(map) if freeze_deadlocks else None
+        self.patterns = get_deadlock_patterns(map) if deadlock_patterns else None
+        self.explored = 0
+        self.pruned = 0
 
     def search(self):
-
         answer = {}
         answer['execution_time'] = time.time()  # To substract from the end time
-        answer['frontier'] = 0
-
-        if isinstance(self.heuristics, (ManhattanDistanceWithDeadlockDetection)):
-            h_n = self.heuristics.get(self.initial_state.boxes, self.valid_box_positions)
-        elif isinstance(self.heuristics, (CombinedHeuristicWithDeadlockDetection)):
-            h_n = self.heuristics.get(self.initial_state.boxes, self.initial_state.player, self.valid_box_positions)
-        elif isinstance(self.heuristics, (ManhattanDistanceWithCorralDeadlockDetection)):
-            h_n = self.heuristics.get(self.initial_state.boxes, self.initial_state.player, self.valid_box_positions, self.initial_state.box_moved)
-        elif isinstance(self.heuristics, (ManhattanDistance, ManhattanImproved)):
-            # ManhattanDistance and ManhattanImproved only take boxes
-            h_n = self.heuristics.get(self.initial_state.boxes)
-        else:
-            # PlayerDistance or CombinedHeuristic take boxes and player
-            h_n = self.heuristics.get(self.initial_state.boxes, self.initial_state.player)
-
-        heapq.heappush(self.priority_queue, (h_n, self.initial_state))  # (h(n), state)
-        self.best_heuristic[self.initial_state] = h_n
-
-        while self.priority_queue:
-            current_h_n, current_state = heapq.heappop(self.priority_queue)
-
-            if current_state.is_goal():
-                f = open("data/stats.csv","a")
-                line = f"{self.map.name},Greedy,{self.heuristics.__class__.__name__},{(time.time() - answer['execution_time']) * 1000},{len(self.explored)},{len(self.priority_queue) + len(self.explored)},{len(self.get_path(current_state)[0])}\n"
-                f.write(line)
-                f.close()
-                answer['execution_time'] = (time.time() - answer['execution_time']) * 1000 
-                answer['path'] = self.get_path(current_state)[0]
-                answer['directions'] = self.get_path(current_state)[1]
-                answer['explored'] = len(self.explored) 
-                answer['frontier'] = len(self.explored) + len(self.priority_queue)
-                answer['result'] = "Éxito"
-                return answer
-
-            self.explored.add(current_state)
-
-            for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                new_state = current_state.move(direction, self.map)
-                if new_state is None or new_state in self.explored:
-                    continue
-
-                if isinstance(self.heuristics, (ManhattanDistanceWithDeadlockDetection)):
-                    h_n = self.heuristics.get(new_state.boxes, self.valid_box_positions)
-                elif isinstance(self.heuristics, (CombinedHeuristicWithDeadlockDetection)):
-                    h_n = self.heuristics.get(new_state.boxes, new_state.player, self.valid_box_positions)
-                elif isinstance(self.heuristics, (ManhattanDistanceWithCorralDeadlockDetection)):
-                    h_n = self.heuristics.get(new_state.boxes, new_state.player, self.valid_box_positions, self.box_moved)
-                elif isinstance(self.heuristics, (ManhattanDistance, ManhattanImproved)):
-                    # ManhattanDistance and ManhattanImproved only take boxes
-                    h_n = self.heuristics.get(new_state.boxes) 
-                else:
-                    # PlayerDistance or CombinedHeuristic take boxes and player
-                    h_n = self.heuristics.get(new_state.boxes, new_state.player)
-
-                if new_state not in self.best_heuristic or h_n < self.best_heuristic[new_state]:
-                    self.best_heuristic[new_state] = h_n
-                    heapq.heappush(self.priority_queue, (h_n, new_state))
-                    self.parent[new_state] = (current_state, direction)
-
-        print("No path found.")
+        pattern_start = self.patterns.hits if self.patterns is not None else 0
+
+        width = self.beam_width
+        for attempt in range(self.restarts + 1):
+            if attempt > 0:
+                width *= self.widening
+            moves = self.beam(width)
+            if moves is not None:
+                break
+        if self.patterns is not None:
+            self.patterns.save()
+
+        answer['beam_width'] = width
+        answer['restarts'] = attempt
+        answer['pruned'] = self.pruned
+        answer['pattern_hits'] = self.patterns.hits - pattern_start if self.patterns is not None else 0
+        answer['cache_hits'], answer['cache_misses'] = self.evaluator.cache_counters()
+        answer['explored'] = self.explored
+        answer['frontier'] = self.explored
+        if moves is None:
+            print("No path found.")
+            answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
+            answer['path'] = []
+            answer['directions'] = []
+            answer['g_n'] = 0
+            answer['result'] = "Fracaso"
+            return answer
+
+        path, directions = self.get_path(moves)
+        f = open("data/stats.csv","a")
+        line = f"{self.map.name},{self.algorithm},{self.heuristics.__class__.__name__},{(time.time() - answer['execution_time']) * 1000},{self.explored},{self.explored},{len(path)}\n"
+        f.write(line)
+        f.close()
         answer['execution_time'] = (time.time() - answer['execution_time']) * 1000
-        answer['path'] = []
-        answer['directions'] = []
-        answer['explored'] = len(self.explored)
-        answer['g_n'] = 0
-        answer['result'] = "Fracaso"
+        answer['path'] = path
+        answer['directions'] = directions
+        answer['g_n'] = len(directions)
+        answer['result'] = "Exito"
         return answer
 
-    def get_path(self, state):
-        path = []
-        directions = []
-    
-        while state in self.parent:
-            parent_state, direction = self.parent[state]
-            path.append(state)
-            directions.append(direction)
-            state = parent_state
-    
-        path.append(self.initial_state)
-        path.reverse()
-        directions.reverse()
-        return path, directions
-    
+    # One beam search of the given width. Returns the moves to a goal as a linked list (move, previous moves),
+    # () for the initial state, or None when the beam runs out of states
+    def beam(self, width):
+        if self.initial_state.is_goal():
+            return ()
+        self.evaluator.evaluate(self.initial_state)
+        seen = {self.initial_state.hash}
+        layer = [(self.initial_state, ())]
+        while layer:
+            # Best child of the layer for each state key: (h, order, state, moves)
+            candidates = {}
+            for state, moves in layer:
+                self.explored += 1
+                children = []
+                for new_state, move, cost in get_successors(state, self.map, self.push_level):
+                    if new_state.hash in seen:
+                        continue
+                    if is_deadlocked_push(new_state, move, self.map, self.push_level, self.dead_squares, self.patterns):
+                        self.pruned += 1
+                        continue
+                    children.append((new_state, move))
+
+                h_values = self.evaluator.evaluate_children(state, children)
+                for (new_state, move), h_n in zip(children, h_values):
+                    if h_n == float('inf'):
+                        continue
+                    if new_state.is_goal():
+                        return (move, moves)
+                    candidate = candidates.get(new_state.hash)
+                    if candidate is None or h_n < candidate[0]:
+                        candidates[new_state.hash] = (h_n, len(candidates), new_state, (move, moves))
+
+            layer = []
+            for h_n, _, new_state, new_moves in heapq.nsmallest(width, candidates.values(), key=lambda candidate: candidate[:2]):
+                seen.add(new_state.hash)
+                layer.append((new_state, new_moves))
+        return None
+
+    def get_path(self, moves):
+        reversed_moves = []
+        while moves:
+            move, moves = moves
+            reversed_moves.append(move)
+        reversed_moves.reverse()
+        directions = expand_pushes(self.initial_state, reversed_moves, self.map) if self.push_level else reversed_moves
+        return replay_path(self.initial_state, directions, self.map), directions
 
-def load_map(map_file):
-    with open(map_file, "r") as f:
-        return [list(line.strip()) for line in f.readlines()]
-    
 def execute_g(greedy):
     answer = greedy.search()
 
@@ -124,125 +141,111 @@ def execute_g(greedy):
     print("-----")
     return answer
 
-def get_greedy(data_map, heuristic, valid_box_positions):
-    map = MapInfo(load_map(data_map), data_map)
+def get_greedy(data_map, heuristic, valid_box_positions, push_level=False, lazy=False):
+    map = compile_map(data_map, data_map)
 
     manhattan_distance = ManhattanDistance(map.targets)
     manhattan_improved = ManhattanImproved(map.targets)
-    manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets)
-    manhattan_with_corral_deadlock_detection = ManhattanDistanceWithCorralDeadlockDetection(map.targets,map.walls)
+    manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets, map.walls, map)
+    manhattan_with_corral_deadlock_detection = ManhattanDistanceWithCorralDeadlockDetection(map.targets, map.walls, map)
     player_distance = PlayerDistance(map.targets)
     combined_heuristic = CombinedHeuristic(map.targets)
-    combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets)
+    combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets, map.walls, map)
 
-    initial_state = State(map.boxes, map.player, map.targets)
+    initial_state = State.from_map(map)
 
     if heuristic == "manhattan_distance":
         print("Greedy - Manhattan Distance")
-        greedy_manhattan = Greedy(initial_state, manhattan_distance, map, valid_box_positions)
+        greedy_manhattan = Greedy(initial_state, manhattan_distance, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_manhattan)
         write_output("Greedy_manhattan", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "manhattan_improved":
         print("Greedy - Manhattan Improved")
-        greedy_manhattan_improved = Greedy(initial_state, manhattan_improved, map, valid_box_positions)
+        greedy_manhattan_improved = Greedy(initial_state, manhattan_improved, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_manhattan_improved)
         write_output("Greedy_manhattan_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
     
     if heuristic == "manhattan_with_deadlock_detection":
         print("Greedy - Manhattan With Deadlock Detection")
-        greedy_manhattan_deadlock= Greedy(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions)
+        greedy_manhattan_deadlock= Greedy(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_manhattan_deadlock)
         write_output("Greedy_manhattan_with_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
     
     if heuristic == "manhattan_with_corral_deadlock_detection":
         print("Greedy - Manhattan With Corral Deadlock Detection")
-        greedy_manhattan_corral_deadlock = Greedy(initial_state, manhattan_with_corral_deadlock_detection, map, valid_box_positions)
+        greedy_manhattan_corral_deadlock = Greedy(initial_state, manhattan_with_corral_deadlock_detection, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_manhattan_corral_deadlock)
         write_output("Greedy_manhattan_with_corral_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
     if heuristic == "player_distance":
         print("Greedy - Player Distance")
-        greedy_player_distance = Greedy(initial_state, player_distance, map, valid_box_positions)
+        greedy_player_distance = Greedy(initial_state, player_distance, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_player_distance)
         write_output("Greedy_player_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
     
     if heuristic == "combined":
         print("Greedy - Combined")
-        greedy_combined = Greedy(initial_state, combined_heuristic, map, valid_box_positions)
+        greedy_combined = Greedy(initial_state, combined_heuristic, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_combined)
         write_output("Greedy_combined", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
     
     if heuristic == "combined_with_deadlock_detection":
         print("Greedy - Combined With Deadlock Detection")
-        greedy_combined_deadlock = Greedy(initial_state, combined_heuristic_with_deadlock_detection, map, valid_box_positions)
+        greedy_combined_deadlock = Greedy(initial_state, combined_heuristic_with_deadlock_detection, map, valid_box_positions, push_level=push_level, lazy=lazy)
         answer = execute_g(greedy_combined_deadlock)
         write_output("Greedy_combined_with_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
         return answer
 
+    if heuristic == "push_distance":
+        print("Greedy - Push Distance")
+        greedy_push_distance = Greedy(initial_state, PushDistance(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_g(greedy_push_distance)
+        write_output("Greedy_push_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
+    if heuristic == "push_distance_improved":
+        print("Greedy - Push Distance Improved")
+        greedy_push_distance_improved = Greedy(initial_state, PushDistanceImproved(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_g(greedy_push_distance_improved)
+        write_output("Greedy_push_distance_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
+    if heuristic == "pattern_database":
+        print("Greedy - Pattern Database")
+        greedy_pattern_database = Greedy(initial_state, PatternDatabaseHeuristic(map.targets, map.walls, map), map, valid_box_positions, push_level=push_level, lazy=lazy)
+        answer = execute_g(greedy_pattern_database)
+        write_output("Greedy_pattern_database", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+        return answer
+
     # if csv not exist create and add header
     if 'stats.csv' not in os.listdir('data'):
         file = open('data/stats.csv', 'w')
         file.write('map,algorithm,heuristic,execution_time,explored,frontier,path_length\n')
         file.close()
 
-def run_g_10_times():
-    maps = []
-    for m in os.listdir('maps'):
-        maps.append(MapInfo(load_map(f"maps/{m}"), m))
-        map = MapInfo(load_map(f"maps/{m}"), m)
-        valid_box_positions = load_all_playable_positions_for_boxes(list(map.targets), list(map.walls)) 
-    
-        manhattan_distance = ManhattanDistance(map.targets)
-        manhattan_improved = ManhattanImproved(map.targets)
-        manhattam_with_corral_deadlock_detection = ManhattanDistanceWithCorralDeadlockDetection(map.targets,map.walls)
-        player_distance = PlayerDistance(map.targets)
-        combined_heuristic = CombinedHeuristic(map.targets)
-        manhattan_with_deadlock_detection = ManhattanDistanceWithDeadlockDetection(map.targets)
-        combined_heuristic_with_deadlock_detection = CombinedHeuristicWithDeadlockDetection(map.targets)
-
-        initial_state = State(map.boxes, map.player, map.targets)
-        
-        print("Greedy - Manhattan Distance")
-        greedy_manhattan = Greedy(initial_state, manhattan_distance, map, valid_box_positions)
-        answer = execute_g(greedy_manhattan)
-        write_output("Greedy_manhattan", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+# Greedy in beam-search mode (see BeamSearch): bounded memory and time, no optimality
+def get_beam(data_map, heuristic, valid_box_positions, beam_width=100, restarts=2, push_level=False):
+    map = compile_map(data_map, data_map)
 
-        print("Greedy - Manhattan Improved")
-        greedy_manhattan_improved = Greedy(initial_state, manhattan_improved, map, valid_box_positions)
-        answer = execute_g(greedy_manhattan_improved)
-        write_output("Greedy_manhattan_improved", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
-
-        print("Greedy - Player Distance")
-        greedy_player_distance = Greedy(initial_state, player_distance, map, valid_box_positions)
-        answer = execute_g(greedy_player_distance)
-        write_output("Greedy_player_distance", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
-        
-        print("Greedy - Combined")
-        greedy_combined = Greedy(initial_state, combined_heuristic, map, valid_box_positions)
-        answer = execute_g(greedy_combined)
-        write_output("Greedy_combined", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
-
-        print("Greedy - Manhattan_with_deadlock_detection")
-        greedy_manhattan_with_deadlock = Greedy(initial_state, manhattan_with_deadlock_detection, map, valid_box_positions)
-        answer = execute_g(greedy_manhattan_with_deadlock)
-        write_output("Greedy_manhattan_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
-
-        print("Greedy - Combined With Deadlock Detection")
-        greedy_combined_with_deadlock = Greedy(initial_state, combined_heuristic_with_deadlock_detection, map, valid_box_positions)
-        answer = execute_g(greedy_combined_with_deadlock)
-        write_output("Greedy_combined_deadlock", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    initial_state = State.from_map(map)
 
+    print(f"Beam ({beam_width}) - {heuristic}")
+    beam_search = BeamSearch(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, beam_width, restarts, push_level=push_level)
+    answer = execute_g(beam_search)
+    write_output(f"Beam_{heuristic}", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
 
-        print("AStar - Manhattan With Corral Deadlock Detection")
-        greedy_manhattan_corral_deadlock = Greedy(initial_state, manhattam_with_corral_deadlock_detection, map, valid_box_positions)
-        execute_g(greedy_manhattan_corral_deadlock)
+# Runs every Greedy heuristic on every map, sharded across worker processes (see batch.py)
+def run_g_10_times(workers=None):
+    from batch import run_batch
+    return run_batch(algorithms=["greedy"], repetitions=10, workers=workers)
 
 def main():
     run_g_10_times()
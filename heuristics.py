@@ -1,15 +1,66 @@
+from collections import OrderedDict
+import numpy as np
 from scipy.optimize import linear_sum_assignment
 from deadlocks import check_simple_deadlock_for_boxes
 from deadlocks import check_corral_deadlock
+from deadlocks import get_push_distances
+from deadlocks import get_dead_squares
+from deadlock_patterns import get_deadlock_patterns
+from pattern_database import get_pattern_database
+
+# Cantidad máxima de configuraciones de cajas guardadas por caché de heurística
+HEURISTIC_CACHE_CAPACITY = 1 << 17
+# Cantidad máxima de veredictos de corrales guardados
+CORRAL_CACHE_CAPACITY = 1 << 14
 
 class HeuristicBase:
-    def __init__(self, goals,walls=None):
+    # Las heurísticas que solo dependen de las cajas (no del jugador) lo indican con box_only = True,
+    # así las búsquedas pueden reutilizar su valor para todas las posiciones del jugador con las mismas cajas
+    box_only = False
+    # Las heurísticas caras indican en cheap_heuristic una clase más barata cuyo valor nunca es mayor que el suyo:
+    # con evaluación perezosa las búsquedas encolan los hijos con ella y calculan la cara solo al sacarlos de la cola
+    cheap_heuristic = None
+
+    def __init__(self, goals,walls=None, map=None):
         self.goals = goals
         self.walls = walls
+        self.map = map
+        # Objetivos como arreglo (objetivos x 2) para las versiones por lote, se arma al primer uso
+        self.goal_array = None
+        self.dead_squares = None
+        self.dead_square_array = None
+
+    # Las heurísticas con versión por lote definen get_batch(boxes, players, valid_boxes): boxes es un arreglo
+    # (estados x cajas x 2) con las coordenadas de las cajas de cada estado y players uno (estados x 2) con las
+    # del jugador. Devuelve un arreglo con un valor por estado
+
+    # Distancia de Manhattan de cada caja a cada objetivo: (estados x cajas x objetivos)
+    def box_goal_distances(self, boxes):
+        if self.goal_array is None:
+            self.goal_array = np.array(sorted(self.goals), dtype=np.int64).reshape(-1, 2)
+        return np.abs(boxes[:, :, None, :] - self.goal_array[None, None, :, :]).sum(axis=3)
+
+    # Celdas muertas del mapa (1 si una caja ahí ya no llega a ningún objetivo), indexadas por celda
+    # Se calculan una vez por mapa, a partir de valid_boxes si se tienen
+    def dead_square_grid(self, valid_boxes=None):
+        if self.dead_squares is None:
+            self.dead_squares = get_dead_squares(self.map, valid_boxes)
+        return self.dead_squares
+
+    def is_simple_deadlock(self, boxes, valid_boxes=None):
+        return check_simple_deadlock_for_boxes(boxes, self.dead_square_grid(valid_boxes), self.map.width)
+
+    # Estados del lote con alguna caja en una celda muerta
+    def batch_deadlocks(self, boxes, valid_boxes):
+        if self.dead_square_array is None:
+            self.dead_square_array = np.frombuffer(self.dead_square_grid(valid_boxes), dtype=np.uint8).astype(bool)
+        return self.dead_square_array[boxes[:, :, 0] * self.map.width + boxes[:, :, 1]].any(axis=1)
 
 # La heurística de Manhattan consiste en la suma de las distancias de cada bloque a su objetivo más cercano
 # No considera obstaculos
 class ManhattanDistance(HeuristicBase):
+    box_only = True
+
     def get(self, boxes):
         manhattan_distance = 0
         for box in boxes:
@@ -18,16 +69,52 @@ class ManhattanDistance(HeuristicBase):
                 min_distance = min(min_distance, abs(box[0] - goal[0]) + abs(box[1] - goal[1]))
             manhattan_distance += min_distance
         return manhattan_distance
+
+    def get_batch(self, boxes, players=None, valid_boxes=None):
+        return self.box_goal_distances(boxes).min(axis=2).sum(axis=1)
+
+    def box_distance(self, box):
+        min_distance = float('inf')
+        for goal in self.goals:
+            min_distance = min(min_distance, abs(box[0] - goal[0]) + abs(box[1] - goal[1]))
+        return min_distance
+
+    # Versión incremental: devuelve (valor, info) para poder calcular los hijos a partir del padre
+    def get_with_info(self, boxes):
+        return self.get(boxes), None
+
+    # Valor del hijo cuando solo se movió una caja (de old_box a new_box): O(objetivos) en lugar de O(cajas x objetivos)
+    # boxes son las cajas del hijo, solo se usan si el valor del padre no sirve como base
+    def get_incremental(self, value, info, old_box, new_box, boxes):
+        if value == float('inf'):
+            return self.get_with_info(boxes)
+        return value - self.box_distance(old_box) + self.box_distance(new_box), None
     
-class ManhattanDistanceWithDeadlockDetection(HeuristicBase):
-    def get(self, boxes, valid_boxes):
-        if check_simple_deadlock_for_boxes(boxes, valid_boxes) :
+# Requiere el mapa (MapInfo) para la grilla de celdas muertas
+class ManhattanDistanceWithDeadlockDetection(ManhattanDistance):
+    def get(self, boxes, valid_boxes=None):
+        if self.is_simple_deadlock(boxes, valid_boxes):
             return float('inf')
         return ManhattanDistance.get(self, boxes)
 
+    def get_with_info(self, boxes):
+        return self.get(boxes), None
+
+    # El padre no estaba en deadlock simple, así que alcanza con mirar la celda de la caja que se movió
+    def get_incremental(self, value, info, old_box, new_box, boxes):
+        if self.dead_square_grid()[new_box[0] * self.map.width + new_box[1]]:
+            return float('inf'), None
+        return ManhattanDistance.get_incremental(self, value, info, old_box, new_box, boxes)
+
+    def get_batch(self, boxes, players, valid_boxes):
+        return np.where(self.batch_deadlocks(boxes, valid_boxes), float('inf'), ManhattanDistance.get_batch(self, boxes))
+
 # Mejora de la heurística de Manhattan: no permite que dos cajas tengan un mismo objetivo
 # No considera obstaculos
 class ManhattanImproved(HeuristicBase):
+    box_only = True
+    cheap_heuristic = ManhattanDistance
+
     def get(self, boxes):
         matrix = []
         for box in boxes:
@@ -43,6 +130,183 @@ class ManhattanImproved(HeuristicBase):
             total_cost += matrix[row_ind[i]][col_ind[i]]
         return total_cost
 
+    # La matriz de costos de todo el lote se arma con NumPy; la asignación se resuelve por estado
+    def get_batch(self, boxes, players=None, valid_boxes=None):
+        values = []
+        for matrix in self.batch_costs(boxes):
+            row_ind, col_ind = linear_sum_assignment(matrix)
+            values.append(matrix[row_ind, col_ind].sum())
+        return np.array(values)
+
+    def batch_costs(self, boxes):
+        return self.box_goal_distances(boxes)
+
+    def box_costs(self, box):
+        return [abs(box[0] - goal[0]) + abs(box[1] - goal[1]) for goal in self.goals]
+
+    def assignment_value(self, costs, owner):
+        return sum(costs[owner[j]][j - 1] for j in range(1, len(owner)))
+
+    # Versión incremental: resuelve la asignación con el algoritmo húngaro propio para quedarse con los potenciales
+    # info = (caja de cada fila, costos por fila, potenciales de filas, potenciales de columnas, fila de cada columna)
+    # Solo para tantas cajas como objetivos; si no, se usa la versión completa sin info
+    def get_with_info(self, boxes):
+        if len(boxes) != len(self.goals):
+            return self.get(boxes), None
+        rows = [None] + list(boxes)
+        costs = [None] + [self.box_costs(box) for box in boxes]
+        u = [0] * len(rows)
+        v = [0] * len(rows)
+        owner = [0] * len(rows)
+        for row in range(1, len(rows)):
+            hungarian_add_row(costs, u, v, owner, row)
+        return self.assignment_value(costs, owner), (rows, costs, u, v, owner)
+
+    # Cuando se mueve una sola caja se libera su fila, se reemplazan sus costos y se la vuelve a asignar
+    # con un único camino de aumento: O(objetivos²) en lugar de rehacer toda la asignación
+    def get_incremental(self, value, info, old_box, new_box, boxes):
+        if info is None:
+            return self.get_with_info(boxes)
+        rows, costs, u, v, owner = info
+        rows = rows.copy()
+        costs = costs.copy()
+        u = u.copy()
+        v = v.copy()
+        owner = owner.copy()
+
+        row = rows.index(old_box, 1)
+        rows[row] = new_box
+        costs[row] = self.box_costs(new_box)
+        owner[owner.index(row, 1)] = 0
+        # Con v <= 0 y costos >= 0, u = 0 mantiene factibles los potenciales de la fila nueva
+        u[row] = 0
+        hungarian_add_row(costs, u, v, owner, row)
+        return self.assignment_value(costs, owner), (rows, costs, u, v, owner)
+
+# Base de datos de patrones aditiva: costo exacto de empuje de grupos de cajas (pares por defecto) resueltos solos,
+# precalculado una vez por mapa y leído de archivos mapeados en memoria (ver pattern_database.py).
+# Suma los costos de los grupos en la partición de las cajas con mayor suma, que sigue siendo admisible
+# porque cada grupo solo empuja sus propias cajas. Requiere el mapa (MapInfo)
+class PatternDatabaseHeuristic(HeuristicBase):
+    box_only = True
+
+    def __init__(self, goals, walls=None, map=None):
+        super().__init__(goals, walls, map)
+        self.database = get_pattern_database(map)
+
+    def get(self, boxes):
+        return self.database.cost([self.map.index(box) for box in boxes])
+
+    def get_batch(self, boxes, players=None, valid_boxes=None):
+        cells = (boxes[:, :, 0] * self.map.width + boxes[:, :, 1]).tolist()
+        return np.array([self.database.cost(state_cells) for state_cells in cells], dtype=float)
+
+# Paso del algoritmo húngaro con potenciales (filas y columnas indexadas desde 1, la columna 0 es auxiliar):
+# asigna la fila libre `row` por el camino de aumento de menor costo reducido, manteniendo óptima la asignación
+# de las demás filas. costs[i] son los costos de la fila i, owner[j] la fila asignada a la columna j (0 si está libre)
+def hungarian_add_row(costs, u, v, owner, row):
+    columns = len(v) - 1
+    way = [0] * (columns + 1)
+    minv = [float('inf')] * (columns + 1)
+    used = [False] * (columns + 1)
+    owner[0] = row
+    j0 = 0
+    while True:
+        used[j0] = True
+        i0 = owner[j0]
+        row_costs = costs[i0]
+        delta = float('inf')
+        j1 = 0
+        for j in range(1, columns + 1):
+            if not used[j]:
+                current = row_costs[j - 1] - u[i0] - v[j]
+                if current < minv[j]:
+                    minv[j] = current
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+        for j in range(columns + 1):
+            if used[j]:
+                u[owner[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if owner[j0] == 0:
+            break
+    # Invierte el camino de aumento
+    while j0:
+        j1 = way[j0]
+        owner[j0] = owner[j1]
+        j0 = j1
+
+# Variante de ManhattanDistance con distancias reales de empuje (considera paredes y pasillos):
+# para cada caja, la mínima cantidad de empujes hasta algún objetivo, precalculada por celda del mapa
+# Requiere el mapa (MapInfo) para la tabla de distancias
+class PushDistance(ManhattanDistance):
+    def __init__(self, goals, walls=None, map=None):
+        super().__init__(goals, walls, map)
+        self.width = map.width
+        self.goal_distances, self.min_distances = get_push_distances(map)
+        self.min_distance_array = np.array(self.min_distances, dtype=float)
+
+    def get(self, boxes):
+        push_distance = 0
+        for box in boxes:
+            push_distance += self.min_distances[box[0] * self.width + box[1]]
+        return push_distance
+
+    def get_batch(self, boxes, players=None, valid_boxes=None):
+        return self.min_distance_array[boxes[:, :, 0] * self.width + boxes[:, :, 1]].sum(axis=1)
+
+    def box_distance(self, box):
+        return self.min_distances[box[0] * self.width + box[1]]
+
+# Variante de ManhattanImproved con distancias reales de empuje: asignación caja-objetivo sin repetir objetivos
+class PushDistanceImproved(ManhattanImproved):
+    cheap_heuristic = PushDistance
+
+    def __init__(self, goals, walls=None, map=None):
+        super().__init__(goals, walls, map)
+        self.width = map.width
+        self.goal_distances, self.min_distances = get_push_distances(map)
+        # Costo finito para los pares caja-objetivo imposibles (linear_sum_assignment no acepta inf)
+        self.unreachable = map.size * max(len(goals), 1)
+        self.finite_goal_distances = [[distance if distance != float('inf') else self.unreachable for distance in distances] for distances in self.goal_distances]
+        self.finite_goal_array = np.array(self.finite_goal_distances, dtype=np.int64).reshape(map.size, len(goals))
+
+    def get(self, boxes):
+        matrix = []
+        for box in boxes:
+            cell = box[0] * self.width + box[1]
+            # Caja en una celda desde la que no llega a ningún objetivo
+            if self.min_distances[cell] == float('inf'):
+                return float('inf')
+            matrix.append(self.finite_goal_distances[cell])
+
+        row_ind, col_ind = linear_sum_assignment(matrix)
+        total_cost = 0
+        for i in range(len(row_ind)):
+            total_cost += matrix[row_ind[i]][col_ind[i]]
+        if total_cost >= self.unreachable:
+            return float('inf')
+        return total_cost
+
+    def get_batch(self, boxes, players=None, valid_boxes=None):
+        values = ManhattanImproved.get_batch(self, boxes)
+        return np.where(values >= self.unreachable, float('inf'), values)
+
+    def batch_costs(self, boxes):
+        return self.finite_goal_array[boxes[:, :, 0] * self.width + boxes[:, :, 1]]
+
+    def box_costs(self, box):
+        return self.finite_goal_distances[box[0] * self.width + box[1]]
+
+    def assignment_value(self, costs, owner):
+        total_cost = ManhattanImproved.assignment_value(self, costs, owner)
+        return float('inf') if total_cost >= self.unreachable else total_cost
+
 # Calcula la distancia mínima del jugador a cada caja
 class PlayerDistance(HeuristicBase):
     def get(self, boxes, player):
@@ -50,23 +314,92 @@ class PlayerDistance(HeuristicBase):
         for box in boxes:
             min_distance = min(min_distance, abs(player[0] - box[0]) + abs(player[1] - box[1]))
         return min_distance
+
+    def get_batch(self, boxes, players, valid_boxes=None):
+        return np.abs(boxes - players[:, None, :]).sum(axis=2).min(axis=1)
     
 # Combinación de las heurísticas de Manhattan y PlayerDistance
 # Retorna la suma de ambas
 class CombinedHeuristic(HeuristicBase):
     def get(self, boxes, player):
-        return ManhattanDistance(self.goals).get(boxes) + PlayerDistance(self.goals).get(boxes, player)
+        return ManhattanDistance.get(self, boxes) + PlayerDistance.get(self, boxes, player)
+
+    def get_batch(self, boxes, players, valid_boxes=None):
+        return ManhattanDistance.get_batch(self, boxes) + PlayerDistance.get_batch(self, boxes, players)
     
+# Requiere el mapa (MapInfo) para la grilla de celdas muertas
 class CombinedHeuristicWithDeadlockDetection(HeuristicBase):
-    def get(self, boxes, player, valid_boxes):
-        if check_simple_deadlock_for_boxes(boxes, valid_boxes):
+    def get(self, boxes, player, valid_boxes=None):
+        if self.is_simple_deadlock(boxes, valid_boxes):
             return float('inf')
-        return CombinedHeuristic(self.goals).get(boxes, player)
+        return CombinedHeuristic.get(self, boxes, player)
+
+    def get_batch(self, boxes, players, valid_boxes):
+        return np.where(self.batch_deadlocks(boxes, valid_boxes), float('inf'), CombinedHeuristic.get_batch(self, boxes, players))
     
+# Requiere el mapa (MapInfo). Solo analiza los corrales después de mover una caja y guarda el veredicto
+# de cada corral (sus cajas y celdas) para no repetir la búsqueda cuando vuelve a aparecer
 class ManhattanDistanceWithCorralDeadlockDetection(HeuristicBase):
-    def get(self, boxes,player, valid_boxes,box_moved):
-        if check_corral_deadlock(self.walls,self.goals,player,list(boxes),box_moved,valid_boxes):
+    cheap_heuristic = ManhattanDistance
+
+    def __init__(self, goals, walls=None, map=None):
+        super().__init__(goals, walls, map)
+        self.corral_verdicts = HeuristicCache(CORRAL_CACHE_CAPACITY)
+        # Los corrales que resultan deadlock se aprenden como patrones para las próximas búsquedas
+        self.patterns = get_deadlock_patterns(map)
+
+    # region: celdas alcanzables por el jugador (bytearray por celda) si ya se calcularon para el estado
+    def get(self, boxes,player, valid_boxes,box_moved, region=None):
+        if box_moved and check_corral_deadlock(self.map, [self.map.index(box) for box in boxes], self.map.index(player), self.dead_square_grid(valid_boxes), self.corral_verdicts, region=region, patterns=self.patterns):
             return float('inf')
-        return ManhattanDistance(self.goals).get(boxes)
+        return ManhattanDistance.get(self, boxes)
+
+# Caché de valores de una heurística por configuración de cajas, con tamaño acotado:
+# cuando se llena se descarta la entrada usada hace más tiempo (LRU)
+class HeuristicCache:
+    def __init__(self, capacity=HEURISTIC_CACHE_CAPACITY):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+# Una caché por heurística y mapa, compartida por todas las búsquedas del proceso (A*, Greedy y corridas repetidas)
+HEURISTIC_CACHES = {}
+
+def get_heuristic_cache(heuristic, map, capacity=HEURISTIC_CACHE_CAPACITY):
+    key = (heuristic.__class__.__name__, map.layout)
+    if key not in HEURISTIC_CACHES:
+        HEURISTIC_CACHES[key] = HeuristicCache(capacity)
+    return HEURISTIC_CACHES[key]
+
+# Nombre (el mismo que reciben get_astar / get_greedy) -> clase de la heurística
+HEURISTICS = {
+    "manhattan_distance": ManhattanDistance,
+    "manhattan_improved": ManhattanImproved,
+    "manhattan_with_deadlock_detection": ManhattanDistanceWithDeadlockDetection,
+    "manhattan_with_corral_deadlock_detection": ManhattanDistanceWithCorralDeadlockDetection,
+    "player_distance": PlayerDistance,
+    "combined": CombinedHeuristic,
+    "combined_with_deadlock_detection": CombinedHeuristicWithDeadlockDetection,
+    "push_distance": PushDistance,
+    "push_distance_improved": PushDistanceImproved,
+    "pattern_database": PatternDatabaseHeuristic,
+}
 
-        
\ No newline at end of file
+def build_heuristic(name, map):
+    return HEURISTICS[name](map.targets, map.walls, map)
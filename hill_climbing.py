@@ -0,0 +1,153 @@
+import time
+from collections import deque
+from a_star import State, A_star, Evaluator, get_successors, expand_pushes, replay_path, is_deadlocked_push, execute_a
+from greedy import Greedy
+from heuristics import build_heuristic
+from deadlocks import get_dead_squares
+from deadlock_patterns import get_deadlock_patterns
+from generate_outputs import write_output
+from map import compile_map
+
+# Searches run from the initial state when hill climbing reaches a dead end
+FALLBACKS = {"greedy": Greedy, "astar": A_star}
+
+# Enforced hill climbing: from the current state, a breadth-first search runs until it finds any state with a
+# strictly lower heuristic (or a goal), the search commits to it and forgets everything else. Only the states of
+# the current breadth-first search are kept. When one of them runs out of states (or goes over max_nodes) the
+# climb is at a dead end, and the `fallback` search ("greedy", "astar" or None) is run from the initial state.
+class EnforcedHillClimbing:
+    algorithm = "EHC"
+
+    def __init__(self, initial_state, heuristics, map, valid_box_positions, fallback="greedy", max_nodes=None, push_level=False, use_cache=True, freeze_deadlocks=True, deadlock_patterns=True):
+        if fallback is not None and fallback not in FALLBACKS:
+            raise ValueError(f"Unknown fallback: {fallback}")
+        if push_level:
+            initial_state = initial_state.normalized(map)
+        self.initial_state = initial_state
+        self.heuristics = heuristics
+        self.map = map
+        self.valid_box_positions = valid_box_positions
+        self.fallback = fallback
+        self.max_nodes = max_nodes
+        self.push_level = push_level
+        self.use_cache = use_cache
+        self.freeze_deadlocks = freeze_deadlocks
+        self.deadlock_patterns = deadlock_patterns
+        self.evaluator = Evaluator(heuristics, map, valid_box_positions, push_level, use_cache)
+        self.dead_squares = get_dead_squares(map) if freeze_deadlocks else None
+        self.patterns = get_deadlock_patterns(map) if deadlock_patterns else None
+        self.explored = 0
+        self.pruned = 0
+        self.episodes = 0
+
+    def search(self):
+        start = time.time()
+        moves = self.climb()
+        if self.patterns is not None:
+            self.patterns.save()
+
+        if moves is None and self.fallback is not None:
+            print(f"Dead end after {self.episodes} improvements, falling back to {self.fallback}")
+            searcher = FALLBACKS[self.fallback](self.initial_state, self.heuristics, self.map, self.valid_box_positions, push_level=self.push_level, use_cache=self.use_cache, freeze_deadlocks=self.freeze_deadlocks, deadlock_patterns=self.deadlock_patterns)
+            answer = searcher.search()
+            answer['execution_time'] = (time.time() - start) * 1000
+            answer['explored'] += self.explored
+            answer['frontier'] += self.explored
+            answer['pruned'] += self.pruned
+            answer['episodes'] = self.episodes
+            answer['fallback'] = self.fallback
+            return answer
+
+        answer = {}
+        answer['explored'] = self.explored
+        answer['frontier'] = self.explored
+        answer['pruned'] = self.pruned
+        answer['episodes'] = self.episodes
+        answer['fallback'] = None
+        if moves is None:
+            print("No path found.")
+            answer['execution_time'] = (time.time() - start) * 1000
+            answer['path'] = []
+            answer['directions'] = []
+            answer['g_n'] = 0
+            answer['result'] = "Fracaso"
+            return answer
+
+        path, directions = self.get_path(moves)
+        f = open("data/stats.csv","a")
+        line = f"{self.map.name},{self.algorithm},{self.heuristics.__class__.__name__},{(time.time() - start) * 1000},{self.explored},{self.explored},{len(path)}\n"
+        f.write(line)
+        f.close()
+        answer['execution_time'] = (time.time() - start) * 1000
+        answer['path'] = path
+        answer['directions'] = directions
+        answer['g_n'] = len(directions)
+        answer['result'] = "Exito"
+        return answer
+
+    # Moves from the initial state to a goal, or None at a dead end
+    def climb(self):
+        state = self.initial_state
+        h = self.evaluator.evaluate(state)
+        if h == float('inf'):
+            return None
+        moves = []
+        while not state.is_goal():
+            improvement = self.improve(state, h)
+            if improvement is None:
+                return None
+            state, h, episode_moves = improvement
+            moves += episode_moves
+            self.episodes += 1
+        return moves
+
+    # Breadth-first search from state until a state with a heuristic below h or a goal.
+    # Returns (that state, its heuristic, moves from state to it), or None if there is none
+    def improve(self, state, h):
+        parents = {state: None}
+        queue = deque([state])
+        while queue:
+            current = queue.popleft()
+            self.explored += 1
+            children = []
+            for new_state, move, cost in get_successors(current, self.map, self.push_level):
+                if new_state in parents:
+                    continue
+                if is_deadlocked_push(new_state, move, self.map, self.push_level, self.dead_squares, self.patterns):
+                    self.pruned += 1
+                    continue
+                parents[new_state] = (current, move)
+                children.append((new_state, move))
+
+            h_values = self.evaluator.evaluate_children(current, children)
+            for (new_state, move), h_n in zip(children, h_values):
+                if h_n == float('inf'):
+                    continue
+                if h_n < h or new_state.is_goal():
+                    return new_state, h_n, self.episode_moves(new_state, parents)
+                queue.append(new_state)
+            if self.max_nodes is not None and len(parents) > self.max_nodes:
+                return None
+        return None
+
+    def episode_moves(self, state, parents):
+        moves = []
+        while parents[state] is not None:
+            state, move = parents[state]
+            moves.append(move)
+        moves.reverse()
+        return moves
+
+    def get_path(self, moves):
+        directions = expand_pushes(self.initial_state, moves, self.map) if self.push_level else moves
+        return replay_path(self.initial_state, directions, self.map), directions
+
+def get_ehc(data_map, heuristic, valid_box_positions, fallback="greedy", max_nodes=None, push_level=False):
+    map = compile_map(data_map, "")
+    initial_state = State.from_map(map)
+
+    print(f"EHC - {heuristic}")
+    ehc = EnforcedHillClimbing(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, fallback, max_nodes, push_level)
+    answer = execute_a(ehc)
+    write_output(f"EHC_{heuristic}", answer["result"], answer["path"], answer["explored"], answer["frontier"], answer["execution_time"], len(answer["path"]), False)
+    return answer
@@ -1,8 +1,113 @@
+import hashlib
+import os
+import pickle
+import random
+import numpy as np
+from deadlocks import load_all_playable_positions_for_boxes, get_dead_squares, get_push_distances
+
+ZOBRIST_SEED = 20240901
+
+COMPILED_MAP_DIRECTORY = 'data/compiled_maps'
+# Part of the cache key, bump it when MapInfo or its precomputed tables change so old files are not loaded
+COMPILED_MAP_VERSION = 1
+
 class MapInfo:
     def __init__(self, map, name):
         self.map = map
         self.name = name
+        # Text of the map, identifies the same level across runs (e.g. for the heuristic caches)
+        self.layout = "\n".join("".join(row) for row in map)
         self.targets = {(x, y) for x, row in enumerate(map) for y, cell in enumerate(row) if cell == "."}
         self.boxes = {(x, y) for x, row in enumerate(map) for y, cell in enumerate(row) if cell == "$"}
         self.player = next((x, y) for x, row in enumerate(map) for y, cell in enumerate(row) if cell == "@")
-        self.walls = {(x, y) for x, row in enumerate(map) for y, cell in enumerate(row) if cell == "#"}
\ No newline at end of file
+        self.walls = {(x, y) for x, row in enumerate(map) for y, cell in enumerate(row) if cell == "#"}
+
+        # Flattened grid: cell (x, y) is stored at index x * width + y.
+        # The extra column keeps horizontal moves from wrapping into the next row.
+        self.height = len(map)
+        self.width = max(len(row) for row in map) + 1
+        self.size = self.height * self.width
+
+        # Cells outside the (stripped) rows count as walls
+        self.wall_cells = bytearray(b"\x01" * self.size)
+        for x, row in enumerate(map):
+            for y, cell in enumerate(row):
+                if cell != "#":
+                    self.wall_cells[x * self.width + y] = 0
+
+        # (x, y) of every cell, to decode whole arrays of cells at once
+        self.coordinates = np.array([self.position(cell) for cell in range(self.size)], dtype=np.int64)
+
+        # Non-wall neighbours of every cell (none for walls), so flood fills skip the wall checks
+        offsets = [self.offset(direction) for direction in ((0, 1), (0, -1), (1, 0), (-1, 0))]
+        self.neighbors = []
+        for cell in range(self.size):
+            if self.wall_cells[cell]:
+                self.neighbors.append(())
+                continue
+            self.neighbors.append(tuple(cell + offset for offset in offsets if 0 <= cell + offset < self.size and not self.wall_cells[cell + offset]))
+
+        self.goal_cells = bytearray(self.size)
+        for goal in self.targets:
+            self.goal_cells[self.index(goal)] = 1
+
+        # Zobrist keys: one random 64-bit number per (cell, piece) so states can be rehashed with two XORs per move
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_box = [rng.getrandbits(64) for _ in range(self.size)]
+        self.zobrist_player = [rng.getrandbits(64) for _ in range(self.size)]
+
+        # Positions from which a box can reach some goal, as [x, y] lists, filled by compile_map
+        self.valid_box_positions = None
+        # Box-to-goal push distances, filled on first use by deadlocks.get_push_distances
+        self.push_distances = None
+        # Cells where a box is a simple deadlock, filled on first use by deadlocks.get_dead_squares
+        self.dead_squares = None
+        # Learned deadlock patterns, loaded on first use by deadlock_patterns.get_deadlock_patterns
+        self.deadlock_patterns = None
+
+    def index(self, position):
+        return position[0] * self.width + position[1]
+
+    def position(self, index):
+        return divmod(index, self.width)
+
+    def offset(self, direction):
+        return direction[0] * self.width + direction[1]
+
+# Rows of a map file as lists of characters
+def load_map(map_file):
+    with open(map_file, "r") as f:
+        return parse_map(f.read())
+
+def parse_map(text):
+    return [list(line.strip()) for line in text.splitlines()]
+
+# Calls writer with a file opened in `mode` aside of path and then renames it over path, so parallel runs
+# never read a half-written file (compiled maps, deadlock patterns and pattern database tables)
+def atomic_write(path, writer, mode="wb"):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, mode) as f:
+        writer(f)
+    os.replace(temporary, path)
+
+# MapInfo of a map file with every per-map table already filled: flattened cells, neighbours, goals, Zobrist keys,
+# valid box positions, dead squares and push distances. The compiled map is pickled in COMPILED_MAP_DIRECTORY under
+# the hash of the file's content, so later runs (and every job of a batch) only load it.
+# The learned deadlock patterns are not part of it, they are kept apart by deadlock_patterns.py.
+def compile_map(map_file, name=None):
+    with open(map_file, "rb") as f:
+        content = f.read()
+    key = hashlib.sha1(content + bytes([COMPILED_MAP_VERSION])).hexdigest()[:16]
+    path = os.path.join(COMPILED_MAP_DIRECTORY, f"{key}.pickle")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            map = pickle.load(f)
+    else:
+        map = MapInfo(parse_map(content.decode()), name)
+        map.valid_box_positions = load_all_playable_positions_for_boxes(list(map.targets), list(map.walls))
+        get_dead_squares(map, map.valid_box_positions)
+        get_push_distances(map)
+        os.makedirs(COMPILED_MAP_DIRECTORY, exist_ok=True)
+        atomic_write(path, lambda f: pickle.dump(map, f, pickle.HIGHEST_PROTOCOL))
+    map.name = name
+    return map
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sys
+from collections import deque
+from itertools import combinations, permutations
+import numpy as np
+from deadlocks import get_dead_squares, reachable_mask, PULL_DIRECTIONS
+from map import atomic_write
+
+PATTERN_DATABASE_DIRECTORY = 'data/pattern_databases'
+# Largest group of boxes solved together
+PATTERN_GROUP_SIZE = 2
+# Table entry of the group configurations that can not be solved
+UNSOLVABLE = np.iinfo(np.uint16).max
+
+# Additive pattern database of a map. For every group of up to group_size boxes on live cells (cells that are not
+# dead squares) it stores the exact number of pushes needed to put that group alone on goals, with the player
+# anywhere. Each group size is a dense uint16 table with one axis per box, indexed by the position of the cells
+# in `cells` and filled for every order of the boxes, so a lookup needs no sorting.
+# Tables are built once per map layout by a backward search and saved as .npy files in PATTERN_DATABASE_DIRECTORY;
+# later runs only memory-map them.
+class PatternDatabase:
+    def __init__(self, map, group_size=PATTERN_GROUP_SIZE, directory=PATTERN_DATABASE_DIRECTORY):
+        self.map = map
+        self.group_size = group_size
+        self.prefix = os.path.join(directory, hashlib.sha1(map.layout.encode()).hexdigest()[:16])
+        self.cells = None
+        # Map cell -> position in cells, -1 for dead squares
+        self.cell_index = None
+        # Group size -> table
+        self.tables = {}
+        self.load()
+
+    def path(self, name):
+        return f"{self.prefix}-{name}.npy"
+
+    def load(self):
+        if not all(os.path.exists(self.path(name)) for name in ['cells'] + list(range(1, self.group_size + 1))):
+            self.build()
+            return
+        self.set_cells(np.load(self.path('cells')).tolist())
+        for size in range(1, self.group_size + 1):
+            self.tables[size] = np.load(self.path(size), mmap_mode='r')
+
+    def build(self):
+        dead_squares = get_dead_squares(self.map)
+        self.set_cells([cell for cell in range(self.map.size) if not dead_squares[cell]])
+        os.makedirs(os.path.dirname(self.prefix), exist_ok=True)
+        cells = np.array(self.cells, dtype=np.int64)
+        atomic_write(self.path('cells'), lambda file: np.save(file, cells))
+        for size in range(1, self.group_size + 1):
+            table = build_group_table(self.map, self.cells, self.cell_index, size)
+            atomic_write(self.path(size), lambda file: np.save(file, table))
+            self.tables[size] = np.load(self.path(size), mmap_mode='r')
+
+    def set_cells(self, cells):
+        self.cells = cells
+        self.cell_index = [-1] * self.map.size
+        for i, cell in enumerate(cells):
+            self.cell_index[cell] = i
+
+    # Lower bound on the pushes left for boxes at the given cells: the largest sum of group costs over the ways
+    # of splitting the boxes into groups of at most group_size. Every group only pushes its own boxes, so any
+    # split is admissible. inf when a box is on a dead square or a group can not be solved.
+    def cost(self, box_cells):
+        indices = []
+        for cell in box_cells:
+            i = self.cell_index[cell]
+            if i < 0:
+                return float('inf')
+            indices.append(i)
+        return self.best_split(tuple(indices), {})
+
+    def best_split(self, indices, memo):
+        if not indices:
+            return 0
+        if indices in memo:
+            return memo[indices]
+        first, rest = indices[0], indices[1:]
+        best = 0
+        for size in range(min(self.group_size, len(indices))):
+            for others in combinations(rest, size):
+                group = (first,) + others
+                value = self.tables[len(group)][group]
+                if value == UNSOLVABLE:
+                    memo[indices] = float('inf')
+                    return float('inf')
+                remaining = tuple(i for i in rest if i not in others)
+                best = max(best, int(value) + self.best_split(remaining, memo))
+        memo[indices] = best
+        return best
+
+# One database per map layout and group size, shared by every search of the process
+PATTERN_DATABASES = {}
+
+def get_pattern_database(map, group_size=PATTERN_GROUP_SIZE):
+    key = (map.layout, group_size)
+    if key not in PATTERN_DATABASES:
+        PATTERN_DATABASES[key] = PatternDatabase(map, group_size)
+    return PATTERN_DATABASES[key]
+
+# Breadth-first search of pulls from every solved configuration of `size` boxes (boxes on distinct goals, player in
+# any region), with only those boxes on the map. States are (sorted box cells, smallest reachable player cell);
+# the first time a box configuration is reached gives its exact push cost to the nearest solved configuration.
+def build_group_table(map, cells, cell_index, size):
+    table = np.full((len(cells),) * size, UNSOLVABLE, dtype=np.uint16)
+    seen = set()
+    frontier = deque()
+    for goals in combinations(sorted(map.index(goal) for goal in map.targets), size):
+        box_set = set(goals)
+        covered = set()
+        for start in range(map.size):
+            if map.wall_cells[start] or start in box_set or start in covered:
+                continue
+            region, canonical = reachable_mask(map, start, box_set)
+            covered.update(cell for cell in range(map.size) if region[cell])
+            seen.add((goals, canonical))
+            frontier.append((goals, region, 0))
+
+    while frontier:
+        boxes, region, pushes = frontier.popleft()
+        group = tuple(cell_index[cell] for cell in boxes)
+        if table[group] == UNSOLVABLE:
+            for order in set(permutations(group)):
+                table[order] = pushes
+
+        box_set = set(boxes)
+        for box_cell in boxes:
+            for direction in PULL_DIRECTIONS:
+                offset = map.offset(direction)
+                # The player stands next to the box and steps back, pulling it
+                new_box_cell = box_cell + offset
+                player_cell = new_box_cell + offset
+                if not region[new_box_cell] or map.wall_cells[player_cell] or player_cell in box_set:
+                    continue
+                # Pulls never reach a dead square, kept as a guard for dead squares built from other positions
+                if cell_index[new_box_cell] < 0:
+                    continue
+                new_boxes = tuple(sorted(cell if cell != box_cell else new_box_cell for cell in boxes))
+                new_region, canonical = reachable_mask(map, player_cell, set(new_boxes))
+                if (new_boxes, canonical) in seen:
+                    continue
+                seen.add((new_boxes, canonical))
+                frontier.append((new_boxes, new_region, pushes + 1))
+    return table
+
+# Builds the databases of every map in maps/ (or of the maps given as arguments) ahead of the solver runs
+def main():
+    from map import compile_map
+    group_size = PATTERN_GROUP_SIZE
+    map_files = sys.argv[1:] or [os.path.join('maps', name) for name in sorted(os.listdir('maps'))]
+    for map_file in map_files:
+        map = compile_map(map_file, os.path.basename(map_file))
+        database = PatternDatabase(map, group_size)
+        print(f"{map_file}: {len(database.cells)} live cells, groups of up to {group_size} boxes -> {database.prefix}-*.npy")
+
+if __name__ == "__main__":
+    main()
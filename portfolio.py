@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from a_star import A_star, State, replay_path
+from greedy import Greedy, BeamSearch
+from hill_climbing import EnforcedHillClimbing
+from heuristics import build_heuristic
+from map import compile_map
+from uninformative_searchs import load_uninformed_problem, uninformed_search_algorithm, is_goal_array, get_children_array, get_push_children_array, normalize_state_array
+
+# (algorithm, heuristic) pairs launched by default. Greedy usually finishes first,
+# A* with an admissible heuristic and step-level BFS give the optimal answer.
+DEFAULT_JOBS = [
+    ("greedy", "manhattan_improved"),
+    ("greedy", "combined_with_deadlock_detection"),
+    ("greedy", "player_distance"),
+    ("astar", "manhattan_distance"),
+    ("astar", "manhattan_with_deadlock_detection"),
+    ("astar", "combined"),
+    ("bfs", None),
+    ("dfs", None),
+]
+
+ADMISSIBLE_HEURISTICS = {"manhattan_distance", "manhattan_improved", "manhattan_with_deadlock_detection", "push_distance", "push_distance_improved", "pattern_database"}
+
+# Only step-level searches are move-optimal: push-level states merge different player positions
+def is_optimal(algorithm, heuristic, push_level):
+    if push_level:
+        return False
+    return algorithm == "bfs" or (algorithm == "astar" and heuristic in ADMISSIBLE_HEURISTICS)
+
+def solve(data_map, algorithm, heuristic, valid_box_positions, push_level=False):
+    map = compile_map(data_map, os.path.basename(data_map))
+    initial_state = State.from_map(map)
+
+    if algorithm == "astar":
+        return A_star(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, push_level=push_level).search()
+    if algorithm == "greedy":
+        return Greedy(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, push_level=push_level).search()
+    if algorithm == "beam":
+        return BeamSearch(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, push_level=push_level).search()
+    if algorithm == "ehc":
+        return EnforcedHillClimbing(initial_state, build_heuristic(heuristic, map), map, valid_box_positions, push_level=push_level).search()
+    if algorithm not in ("bfs", "dfs"):
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+
+    # The BFS/DFS engine only returns the moves, so the rest of the answer is rebuilt from them
+    start_time = time.time()
+    walls, goals, uninformed_state = load_uninformed_problem(data_map)
+    get_children = get_children_array
+    if push_level:
+        uninformed_state = normalize_state_array(uninformed_state, walls)
+        get_children = get_push_children_array
+    moves = uninformed_search_algorithm(map.name, goals, walls, uninformed_state, is_goal_array, get_children, None, algorithm)
+
+    directions = [tuple(move) for move in moves] if moves is not None else []
+    return {
+        'execution_time': (time.time() - start_time) * 1000,
+        'path': replay_path(initial_state, directions, map) if moves is not None else [],
+        'directions': directions,
+        'g_n': len(directions),
+        'result': "Exito" if moves is not None else "Fracaso",
+    }
+
+# Only the directions and scalar fields go back through the worker's own pipe: the path states hold the whole
+# MapInfo, so the parent replays them instead (see receive_answer)
+def run_job(data_map, algorithm, heuristic, valid_box_positions, push_level, connection):
+    try:
+        answer = solve(data_map, algorithm, heuristic, valid_box_positions, push_level)
+        answer = {key: value for key, value in answer.items() if key != 'path'}
+    except Exception as error:
+        answer = {'result': "Fracaso", 'error': repr(error), 'directions': []}
+    connection.send(answer)
+    connection.close()
+
+# Answer of a finished job with its path rebuilt, or a failure if the worker died without sending it
+def receive_answer(connection, initial_state, map):
+    try:
+        answer = connection.recv()
+    except EOFError:
+        return {'result': "Fracaso", 'error': "worker exited without an answer", 'path': [], 'directions': []}
+    answer['path'] = replay_path(initial_state, answer['directions'], map) if answer['result'] == "Exito" else []
+    return answer
+
+# Runs the jobs in parallel worker processes and yields successful answers as they arrive:
+# the first finisher right away and, with wait_for_optimal, later the first optimal one.
+# Every job still running when the generator is done (or closed) is terminated; each worker has its own pipe,
+# so stopping one in the middle of sending can not corrupt the answers of the others.
+# Jobs that crash are reported on stdout with their error.
+def run_portfolio(data_map, valid_box_positions, jobs=DEFAULT_JOBS, workers=None, wait_for_optimal=False, push_level=False):
+    workers = workers or os.cpu_count()
+    map = compile_map(data_map, os.path.basename(data_map))
+    initial_state = State.from_map(map)
+    pending = list(enumerate(jobs))
+    running = {}
+    first_yielded = False
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                index, (algorithm, heuristic) = pending.pop(0)
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=run_job, args=(data_map, algorithm, heuristic, valid_box_positions, push_level, sender), daemon=True)
+                process.start()
+                # Only the worker keeps the sending end, so the pipe reports EOF if it dies without an answer
+                sender.close()
+                running[index] = (process, receiver)
+
+            ready = wait([receiver for _, receiver in running.values()], timeout=0.1)
+            for index, (process, receiver) in list(running.items()):
+                if receiver not in ready:
+                    continue
+                answer = receive_answer(receiver, initial_state, map)
+                running.pop(index)
+                process.join()
+                receiver.close()
+
+                algorithm, heuristic = jobs[index]
+                answer['algorithm'] = algorithm
+                answer['heuristic'] = heuristic
+                answer['optimal'] = is_optimal(algorithm, heuristic, push_level)
+                if 'error' in answer:
+                    print(f"Portfolio - {algorithm} {heuristic or ''} failed: {answer['error']}")
+                if answer['result'] == "Fracaso":
+                    continue
+
+                if not first_yielded:
+                    first_yielded = True
+                    yield answer
+                    if not wait_for_optimal or answer['optimal']:
+                        return
+                elif answer['optimal']:
+                    yield answer
+                    return
+    finally:
+        for process, receiver in running.values():
+            process.terminate()
+        for process, receiver in running.values():
+            process.join()
+            receiver.close()
+
+def get_portfolio(data_map, valid_box_positions, jobs=DEFAULT_JOBS, workers=None, wait_for_optimal=False, push_level=False):
+    answer = None
+    for answer in run_portfolio(data_map, valid_box_positions, jobs, workers, wait_for_optimal, push_level):
+        print(f"Portfolio - {answer['algorithm']} {answer['heuristic'] or ''}")
+        print(f"Execution time: {answer['execution_time']}")
+        print(f"Path length: {len(answer['path'])}")
+        print(f"Optimal: {answer['optimal']}")
+        print("-------")
+    if answer is None:
+        print("No path found.")
+        answer = {'result': "Fracaso", 'path': [], 'directions': []}
+    return answer
@@ -1,7 +1,7 @@
 import os
 import arcade
 from uninformative_searchs import *
-from deadlocks import load_all_playable_positions_for_boxes
+from map import load_map, compile_map
 from greedy import get_greedy
 from a_star import get_astar
 
@@ -19,8 +19,7 @@ ELEMENTS = {
 
 class SokobanGame(arcade.Window):
     def __init__(self, map_file, moves):
-        with open(map_file, "r") as f:
-            self.map_data = [list(line.strip()) for line in f.readlines()]
+        self.map_data = load_map(map_file)
 
         self.walls = [] 
         self.goals = []
@@ -114,7 +113,7 @@ if __name__ == "__main__":
     data_map = "./maps/Medio.txt" #Mapa elegido: Medio.txt
     map_name = os.path.splitext(os.path.basename(data_map))[0]
     game = SokobanGame(data_map, [])
-    valid_box_positions = load_all_playable_positions_for_boxes(game.goals, game.walls)
+    valid_box_positions = compile_map(data_map).valid_box_positions
 
     # Descomentar la línea correspondiente al algoritmo que se desea ejecutar y comentar la que no desee
     # Métodos de búsqueda desinformados (determinar si desea bfs o dfs en el último parámetro)
@@ -1,6 +1,7 @@
 from a_star import run_a_10_times
 from greedy import run_g_10_times
 from uninformative_searchs import run_uninformative_search
+from batch import run_batch
 from heuristics import ManhattanDistance, ManhattanImproved, PlayerDistance, CombinedHeuristic, ManhattanDistanceWithDeadlockDetection, CombinedHeuristicWithDeadlockDetection
 import os
 from matplotlib import pyplot as plt
@@ -513,6 +514,8 @@ def avg_running_time():
     print(f'Tiempo de ejecucion promedio para A*: {a_star_time} error: {df_a_star_mean.std()}')
 
 def main():
+    # Regenera todas las corridas en paralelo (mapa x algoritmo x heurística x repetición), ver batch.py
+    #run_batch(workers=os.cpu_count(), time_limit=60)
     #run_a_10_times()
     #run_g_10_times()
     #run_uninformative_search("dfs")
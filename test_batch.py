@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+import shutil
+import pytest
+import batch
+
+MAPS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maps')
+
+# Runs in a copy of the maps so the solvers' stats and caches do not touch the repository
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    shutil.copytree(MAPS_DIRECTORY, tmp_path / 'maps')
+    (tmp_path / 'data').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+# The workers have to inherit the patched solve, so the start method must be fork
+@pytest.mark.skipif(batch.resource is None or multiprocessing.get_start_method() != "fork", reason="needs the resource module and forked workers")
+def test_job_over_memory_limit_is_reported(workspace, monkeypatch):
+    solve = batch.solve
+
+    # "allocate" asks for 1 GB, far past the 64 MB limit on any machine; the other jobs run the real solver
+    def allocating_solve(map_file, algorithm, heuristic, valid_box_positions, push_level=False):
+        if algorithm == "allocate":
+            bytearray(1 << 30)
+        return solve(map_file, algorithm, heuristic, valid_box_positions, push_level)
+
+    monkeypatch.setattr(batch, 'solve', allocating_solve)
+    rows = batch.run_batch(maps=['maps/Facil.txt'], algorithms=['astar', 'allocate'], heuristics=['manhattan_distance'], repetitions=1, workers=2, memory_limit=64, output=None)
+    results = {row['algorithm']: row['result'] for row in rows}
+    assert results == {'astar': "Exito", 'allocate': "MemoryLimit"}
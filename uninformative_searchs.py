@@ -1,18 +1,25 @@
 import time
+from collections import deque
 from functools import partial
-from map import MapInfo
+from map import compile_map
 import os
 from generate_outputs import write_output, write_output_for_visualization
 
 class Uninformed_State:
-    def __init__(self, boxes, player, move = None):
+    # region: posición que identifica al jugador. Es el propio jugador salvo en la búsqueda por empujes,
+    # donde es la menor posición alcanzable (todas las posiciones de la misma región son equivalentes)
+    # La clave (cajas sin orden, región) se calcula una sola vez: los estados no se modifican después de creados
+    # y se pueden guardar en sets/dicts con comparaciones y hash O(1) amortizado
+    def __init__(self, boxes, player, move = None, region = None):
         self.boxes = boxes
         self.player = player
+        self.region = player if region is None else region
+        self.key = (frozenset(tuple(box) for box in boxes), tuple(self.region))
+        self.hash = hash(self.key)
     def __eq__(self, other):
-        return self.boxes == other.boxes and self.player == other.player
+        return self.hash == other.hash and self.key == other.key
     def __hash__(self):
-        return hash((tuple(tuple(box) for box in self.boxes), 
-                     tuple(self.player)))
+        return self.hash
 
 class Node:
     def __init__(self, state, parent=None, action=None, cost=0, boxed_moved=False, depth = 0):
@@ -38,7 +45,10 @@ class Node:
         path = []
         current_node = self
         while current_node:
-            if current_node.action:
+            if isinstance(current_node.action, tuple):
+                # Acción de empuje: tupla con los pasos de la caminata y el empuje
+                path.extend(reversed(current_node.action))
+            elif current_node.action:
                 path.append(current_node.action)
             current_node= current_node.parent
         return list(reversed(path))          
@@ -70,6 +80,61 @@ def get_children_array(current_node, walls):
 
     return result
 
+# Flood fill de las posiciones a las que llega el jugador sin empujar cajas
+# Devuelve {posición: (posición anterior, dirección)} para poder reconstruir la caminata
+def get_reachable_array(state, walls):
+    boxes = {tuple(box) for box in state.boxes}
+    start = tuple(state.player)
+    came_from = {start: (None, None)}
+    frontier = deque([start])
+    while frontier:
+        position = frontier.popleft()
+        for direction in [[- 1, 0], [0, 1], [1, 0], [0, -1]]:
+            next_position = (position[0] + direction[0], position[1] + direction[1])
+            if next_position in came_from or next_position in walls or next_position in boxes:
+                continue
+            came_from[next_position] = (position, direction)
+            frontier.append(next_position)
+    return came_from
+
+# Estado equivalente identificado por la menor posición de la región del jugador
+def normalize_state_array(state, walls):
+    region = list(min(get_reachable_array(state, walls)))
+    return Uninformed_State(state.boxes, state.player, region=region)
+
+# Sucesores a nivel de empuje: cada hijo es un empuje de caja alcanzable desde la región del jugador
+# La acción es la tupla de pasos (caminata + empuje) para que get_moves devuelva movimientos unitarios
+def get_push_children_array(current_node, walls):
+    last_state = current_node.state
+    came_from = get_reachable_array(last_state, walls)
+    result = []
+    directions= [[- 1, 0], [0, 1], [1, 0], [0, -1]]
+
+    for box in last_state.boxes:
+        for direction in directions:
+            stand_position = (box[0] - direction[0], box[1] - direction[1])
+            if stand_position not in came_from:
+                continue
+            new_box = [box[0] + direction[0], box[1] + direction[1]]
+            if tuple(new_box) in walls or new_box in last_state.boxes:
+                continue
+
+            steps = [direction]
+            position = stand_position
+            while came_from[position][0] is not None:
+                position, step = came_from[position]
+                steps.append(step)
+            steps.reverse()
+
+            new_boxes = last_state.boxes.copy()
+            new_boxes.remove(box)
+            new_boxes.append(new_box)
+            new_state = normalize_state_array(Uninformed_State(new_boxes, list(box)), walls)
+
+            result.append([tuple(steps), new_state, len(steps), True, current_node.depth + 1])
+
+    return result
+
 def is_goal_array(state, goals):
     for box_position in state.boxes:
         if box_position not in goals:
@@ -79,7 +144,7 @@ def is_goal_array(state, goals):
 
 # making sure that the next position is not occupied by a wall or a stucked box
 def check_limits_array(coordinates, walls, last_state, direction):
-    if coordinates in walls:
+    if tuple(coordinates) in walls:
         return False
     if coordinates in last_state.boxes:
         if is_blocked_box_for_direction_array(coordinates, last_state, direction):
@@ -96,16 +161,20 @@ def is_blocked_box_for_direction_array(coordinates, last_state, direction):
     return False
 
 
-def uninformed_search_algorithm(map_name, goals, walls, initial_state, is_goal, get_children, sorting_criteria=None, method="bfs"):
+def uninformed_search_algorithm(map_name, goals, walls, initial_state, is_goal, get_children, sorting_criteria=None, method="bfs", time_limit=None):
     start_time = time.time()
     # 4: Crear Tr, Fr, Exp vacíos
     # Tr se representa implícitamente mediante los enlaces padre en los nodos
-    frontier = []  # Fr
-    explored = []  # Exp
+    # Fr es una deque (pop O(1) por ambos extremos) y en_frontera/Exp son sets de estados,
+    # así que verificar si un hijo ya fue visto es O(1) en lugar de recorrer listas
+    frontier = deque()  # Fr
+    in_frontier = set()
+    explored = set()  # Exp
     
     # 5: Insertar nodo inicial n0 → Tr, Fr
     initial_node = Node(initial_state)
     frontier.append(initial_node)
+    in_frontier.add(initial_state)
     
     # metadata
     iteration = 0
@@ -114,12 +183,13 @@ def uninformed_search_algorithm(map_name, goals, walls, initial_state, is_goal,
     # 6: while Fr ≠ ∅ do
     while frontier:
         # 7: Extraer primer nodo de Fr → n
-        # bfs -> pop(0) -> saco como una cola
+        # bfs -> popleft() -> saco como una cola
         # dfs -> pop() -> saco como una pila
         if (method == "bfs"):
-            current_node = frontier.pop(0)
+            current_node = frontier.popleft()
         else:
             current_node = frontier.pop()
+        in_frontier.discard(current_node.state)
 
         iteration = iteration + 1
         # 8-10: if n Goal then return solución
@@ -129,18 +199,18 @@ def uninformed_search_algorithm(map_name, goals, walls, initial_state, is_goal,
             write_output_for_visualization(map_name,method, (end_time - start_time) * 1000, len(explored), len(explored) + len(frontier), current_node.cost)
             return current_node.get_moves()
 
+        # Presupuesto de tiempo (en segundos) agotado: se corta como si no hubiera solución
+        if time_limit is not None and time.time() - start_time > time_limit:
+            break
+
         # 14: n → Exp
-        explored.append(current_node.state)
+        explored.add(current_node.state)
 
         # 11-13: Expandir el nodo n, sucesores → Fr, Tr
         for move, child_state, cost, boxed_moved, depth in get_children(current_node, walls):
 
-            # Verificar si el estado ya fue explorado
-            if child_state in explored:
-                continue
-
-            # Verificar si el estado ya está en la frontera
-            if any(n.state == child_state for n in frontier):
+            # Verificar si el estado ya fue explorado o si ya está en la frontera
+            if child_state in explored or child_state in in_frontier:
                 continue
 
             # Crear nuevo nodo y añadirlo a la frontera
@@ -153,10 +223,11 @@ def uninformed_search_algorithm(map_name, goals, walls, initial_state, is_goal,
                 depth = depth
             )
             frontier.append(child_node)
+            in_frontier.add(child_state)
 
         # 15: Reordenar Fr según criterio
         if sorting_criteria:
-            frontier.sort(key=sorting_criteria)
+            frontier = deque(sorted(frontier, key=sorting_criteria))
     
     # 17-19: if Solución vacía then No existe solución
     end_time = time.time()
@@ -217,36 +288,39 @@ def is_blocked_box_for_direction(coordinates, last_state, direction):
         return True
     return False
 
-def load_map(map_file):
-    with open(map_file, "r") as f:
-        return [list(line.strip()) for line in f.readlines()]
-
-def run_uninformative_search(method="bfs"):
+# Paredes, objetivos y estado inicial de un mapa en el formato de listas que usan los métodos desinformados
+# Las paredes se devuelven como frozenset de tuplas (fila, columna) para consultarlas en O(1)
+def load_uninformed_problem(map_file):
+    map_data = compile_map(map_file).map
+    walls = [] 
+    goals = []
+    boxes = []
+
+    player_position = [0, 0]
+    for row in range(0, len(map_data)):
+        for col in range(0, len(map_data[0])):
+            current_element = map_data[row][col]
+            match current_element:
+                case '#': 
+                    walls.append((row, col))
+                case '$':
+                    boxes.append([row, col])
+                case '@':
+                    player_position = [row,col]
+                case '.':
+                    goals.append([row, col])
+    return frozenset(walls), goals, Uninformed_State(boxes, player_position)
+
+def run_uninformative_search(method="bfs", push_level=False, time_limit=None):
     if 'stats.csv' not in os.listdir('data'):
         file = open('data/stats.csv', 'w')
         file.write('map,algorithm,heuristic,execution_time,explored,frontier,path_length\n')
         file.close()
 
     for m in os.listdir('maps'):
-        if (m == "Dificil.txt"):
-            continue
-        map_data = load_map(f"maps/{m}")
-        walls = [] 
-        goals = []
-        boxes = []
-
-        player_position = [0, 0]
-        for row in range(0, len(map_data)):
-            for col in range(0, len(map_data[0])):
-                current_element = map_data[row][col]
-                match current_element:
-                    case '#': 
-                        walls.append([row, col])
-                    case '$':
-                        boxes.append([row, col])
-                    case '@':
-                        player_position = [row,col]
-                    case '.':
-                        goals.append([row, col])
-        current_state = Uninformed_State(boxes, player_position)
-        uninformed_search_algorithm(m,goals, walls, current_state, is_goal_array, get_children_array, None, method)
+        walls, goals, current_state = load_uninformed_problem(f"maps/{m}")
+        if push_level:
+            current_state = normalize_state_array(current_state, walls)
+            uninformed_search_algorithm(m,goals, walls, current_state, is_goal_array, get_push_children_array, None, method, time_limit)
+        else:
+            uninformed_search_algorithm(m,goals, walls, current_state, is_goal_array, get_children_array, None, method, time_limit)